@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""
+Measures the cost of scheduling, polling and cancelling timers on a runloop
+with 100,000 pending timers.
+"""
+
+import random
+import time
+
+from zokket.runloop import SelectRunloop
+from zokket.timers import Timer
+
+TIMERS = 100000
+ITERATIONS = 10000
+
+
+def bench(name, func, count):
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    print('{:<32} {:>10.3f}s {:>10.2f}us/op'.format(name, elapsed, elapsed / count * 1e6))
+
+
+def main():
+    runloop = SelectRunloop()
+    callback = lambda timer: None
+    timers = []
+
+    def schedule():
+        for i in range(TIMERS):
+            timers.append(Timer(60 + random.random() * 60, callback, runloop=runloop))
+
+    def next_deadline():
+        for i in range(ITERATIONS):
+            runloop.timer_timeout()
+
+    def idle_pass():
+        for i in range(ITERATIONS):
+            runloop.run_timers()
+
+    def cancel():
+        for timer in timers:
+            timer.invalidate()
+
+    bench('schedule {} timers'.format(TIMERS), schedule, TIMERS)
+    bench('timer_timeout() x{}'.format(ITERATIONS), next_deadline, ITERATIONS)
+    bench('run_timers() x{}'.format(ITERATIONS), idle_pass, ITERATIONS)
+    bench('cancel {} timers'.format(TIMERS), cancel, TIMERS)
+
+    assert runloop.timer_timeout() == 180
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 
 import zokket
 
@@ -10,7 +10,7 @@ class TLSDelegate(object):
     # Socket delegate methods
 
     def socket_did_disconnect(self, sock, err=None):
-        print "Socket: Disconnected ({})".format(err)
+        print("Socket: Disconnected ({})".format(err))
 
     def socket_will_connect(self, sock):
         # Start TLS using mycert.pem as our certificate.
@@ -18,12 +18,12 @@ class TLSDelegate(object):
         return True
 
     def socket_did_secure(self, sock):
-        print "Socket is now secure"
+        print("Socket is now secure")
 
     def socket_read_data(self, sock, data):
-        print "[{}] {}".format(sock, data.strip())
+        print("[{}] {}".format(sock, data.strip()))
 
 if __name__ == '__main__':
-    print "Note: This example requires a SSL certificate to be generated, the example uses mycert.pem"
+    print("Note: This example requires a SSL certificate to be generated, the example uses mycert.pem")
     TLSDelegate()
     zokket.DefaultRunloop.run()
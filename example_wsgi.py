@@ -1,11 +1,11 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 
 import zokket
 
 
 def app(environ, start_response):
     start_response('200 OK', [('Content-type', 'text/plain')])
-    return ['Hello World!']
+    return [b'Hello World!']
 
 if __name__ == '__main__':
     zokket.WSGIServer(app, 'localhost', 8082)
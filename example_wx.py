@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 # An example of wx and zokket, a simple echo server
 
 import zokket
@@ -39,7 +39,7 @@ class EchoServerFrame(wx.Frame):
         sock.send(data)  # Echo data back
 
 if __name__ == '__main__':
-    app = wx.PySimpleApp()
+    app = wx.App(False)
     app.TopWindow = EchoServerFrame()
     app.TopWindow.Show()
     zokket.DefaultRunloop.run_in_new_thread()  # Run the zokket runloop (in a new thread)
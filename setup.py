@@ -1,6 +1,10 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
+
+try:
+    from setuptools import setup
+except ImportError:
+    from distutils.core import setup
 
-from distutils.core import setup
 from zokket import get_version
 
 kwargs = {
@@ -11,7 +15,18 @@ kwargs = {
     'author': 'Kyle Fuller',
     'author_email': 'inbox@kylefuller.co.uk',
     'packages': ['zokket'],
+    'python_requires': '>=3.7',
     'download_url': 'http://github.com/kylef/zokket/zipball/{}'.format(get_version()),
+    'classifiers': [
+        'License :: OSI Approved :: BSD License',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+    ],
 }
 
 setup(**kwargs)
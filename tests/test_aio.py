@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+
+from zokket.aio import AsyncioRunloop
+from zokket.runloop import DefaultRunloop
+from zokket.tcp import TCPSocket
+from zokket.timers import Timer
+
+
+class Echo(object):
+    def socket_read_data(self, sock, data):
+        sock.send(data)
+
+
+class AsyncioRunloopTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.runloop = AsyncioRunloop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_sockets_share_the_asyncio_loop(self):
+        server = TCPSocket(Echo(), runloop=self.runloop)
+        server.accept('127.0.0.1', 0)
+
+        async def client():
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.local_port())
+            writer.write(b'hello')
+            data = await reader.readexactly(5)
+            writer.close()
+            return data
+
+        self.assertEqual(self.loop.run_until_complete(client()), b'hello')
+        server.close()
+        self.assertFalse(any(s is server for s in self.runloop.sockets.values()))
+
+    def test_timers(self):
+        fired = []
+        Timer(0, lambda timer: fired.append(timer), runloop=self.runloop)
+        cancelled = Timer(0, lambda timer: fired.append(timer), runloop=self.runloop)
+        cancelled.invalidate()
+
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(len(fired), 1)
+
+    def test_set_default_uses_the_loop(self):
+        previous = DefaultRunloop.__dict__.get('_runloop')
+        self.addCleanup(setattr, DefaultRunloop, '_runloop', previous)
+
+        other = asyncio.new_event_loop()
+        self.addCleanup(other.close)
+        asyncio.set_event_loop(other)
+        self.addCleanup(asyncio.set_event_loop, None)
+
+        AsyncioRunloop.set_default(self.loop)
+        self.assertTrue(DefaultRunloop.default().loop is self.loop)
+        self.assertTrue(asyncio.get_event_loop_policy().get_event_loop() is other)
+
+    def test_current_event_loop_is_unchanged(self):
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+
+        runloop = AsyncioRunloop()
+        self.addCleanup(runloop.loop.close)
+
+        self.assertFalse(runloop.loop is self.loop)
+        self.assertTrue(asyncio.get_event_loop_policy().get_event_loop() is self.loop)
@@ -0,0 +1,127 @@
+import socket
+import unittest
+
+from zokket.connector import HappyEyeballs, interleave_addresses
+from zokket.runloop import SelectRunloop
+from zokket.tcp import TCPSocket
+from zokket.udp import UDPSocket
+
+
+V4 = socket.AF_INET
+V6 = socket.AF_INET6
+
+
+class StaticResolver(object):
+    def __init__(self, addresses):
+        self.addresses = addresses
+
+    def resolve(self, host, port, callback, family=socket.AF_UNSPEC, runloop=None):
+        runloop.call_soon(callback, self.addresses, None)
+
+
+def closed_port():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    return port
+
+
+class ConnectorTest(unittest.TestCase):
+    def setUp(self):
+        self.runloop = SelectRunloop()
+        self.server = TCPSocket(self, runloop=self.runloop)
+        self.server.accept('', 0)
+        self.port = self.server.local_port()
+        self.accepted = []
+        self.connected = []
+        self.disconnected = []
+
+    def tearDown(self):
+        self.runloop.shutdown()
+
+    def socket_did_accept_new_socket(self, sock, new_sock):
+        self.accepted.append(new_sock)
+
+    def socket_did_connect(self, sock, host, port):
+        self.connected.append((host, port))
+
+    def socket_did_disconnect(self, sock, err=None):
+        self.disconnected.append(err)
+
+    def run_until(self, condition):
+        for i in range(100):
+            if condition():
+                return
+            self.runloop.run_network()
+            self.runloop.run_timers()
+            self.runloop.run_callbacks()
+
+    def test_interleave_addresses(self):
+        addresses = [(V6, 'a'), (V6, 'b'), (V6, 'c'), (V4, 'd')]
+        self.assertEqual(interleave_addresses(addresses),
+                         [(V6, 'a'), (V4, 'd'), (V6, 'b'), (V6, 'c')])
+
+    def test_dual_stack_accept(self):
+        for host in ('127.0.0.1', '::1'):
+            client = TCPSocket(self, runloop=self.runloop)
+            client.connect(host, self.port)
+
+        self.run_until(lambda: len(self.accepted) == 2 and len(self.connected) == 2)
+
+        self.assertEqual(sorted(host for host, port in self.connected),
+                         ['127.0.0.1', '::1'])
+        self.assertEqual(sorted(sock.connected_host() for sock in self.accepted),
+                         ['127.0.0.1', '::1'])
+
+    def test_attempts_are_staggered(self):
+        client = TCPSocket(self, runloop=self.runloop)
+        connector = HappyEyeballs(client, [(V6, ('::1', self.port)),
+                                           (V4, ('127.0.0.1', self.port))], delay=10)
+        connector.start()
+
+        self.assertEqual(len(connector.attempts), 1)
+        self.assertNotEqual(connector.timer, None)
+        connector.cancel()
+
+    def test_failed_address_falls_back(self):
+        client = TCPSocket(self, runloop=self.runloop)
+        client.resolver = StaticResolver([
+            (V4, ('127.0.0.1', closed_port())),
+            (V6, ('::1', self.port)),
+        ])
+        client.connect('backend.test', self.port)
+
+        self.run_until(lambda: self.connected)
+        self.assertEqual(self.connected, [('::1', self.port)])
+        self.assertEqual(client.connector, None)
+
+    def test_all_addresses_fail(self):
+        client = TCPSocket(self, runloop=self.runloop)
+        client.resolver = StaticResolver([
+            (V4, ('127.0.0.1', closed_port())),
+            (V4, ('127.0.0.1', closed_port())),
+        ])
+        client.connect('backend.test', 80)
+
+        self.run_until(lambda: self.disconnected)
+        self.assertEqual(self.connected, [])
+        self.assertEqual(len(self.disconnected), 1)
+        self.assertEqual(client.socket, None)
+
+    def test_udp_dual_stack(self):
+        received = []
+
+        class Delegate(object):
+            def udp_socket_read_data(self, sock, host, port, data):
+                received.append((host, data))
+
+        server = UDPSocket(Delegate(), runloop=self.runloop, family=V6)
+        server.bind('', 0)
+        port = server.socket.getsockname()[1]
+
+        client = UDPSocket(runloop=self.runloop)
+        client.send('127.0.0.1', port, b'ping')
+
+        self.run_until(lambda: received)
+        self.assertEqual(received, [('127.0.0.1', b'ping')])
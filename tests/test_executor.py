@@ -0,0 +1,63 @@
+import threading
+import time
+import unittest
+
+from zokket.executor import RunloopExecutor
+from zokket.runloop import SelectRunloop
+
+
+class HeldSocket(object):
+    def __init__(self):
+        self.read_holds = set()
+
+    def hold_reading(self, owner):
+        self.read_holds.add(owner)
+
+    def release_reading(self, owner):
+        self.read_holds.discard(owner)
+
+
+def work(delay, value):
+    time.sleep(delay)
+    return value
+
+
+class RunloopExecutorTest(unittest.TestCase):
+    def setUp(self):
+        self.runloop = SelectRunloop()
+        self.executor = RunloopExecutor(max_workers=4, max_pending=4, runloop=self.runloop)
+        self.results = []
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def callback(self, future):
+        self.results.append((threading.current_thread(), future.result()))
+
+    def run_until(self, count):
+        deadline = time.time() + 5
+        while len(self.results) < count and time.time() < deadline:
+            self.runloop.run_network()
+            self.runloop.run_callbacks()
+
+    def test_callback_runs_on_runloop_thread(self):
+        self.runloop.register_socket(self.runloop.waker)
+        self.executor.submit(work, (0, 'done'), self.callback)
+
+        self.run_until(1)
+        self.assertEqual(self.results, [(threading.current_thread(), 'done')])
+
+    def test_socket_work_is_ordered_and_pushes_back(self):
+        self.runloop.register_socket(self.runloop.waker)
+        sock = HeldSocket()
+
+        for i in range(4):
+            self.executor.submit(work, (0.01 * (4 - i), i), self.callback, sock)
+
+        self.assertEqual(sock.read_holds, set([self.executor]))
+        self.assertEqual(self.executor.pending(sock), 4)
+
+        self.run_until(4)
+        self.assertEqual([r[1] for r in self.results], [0, 1, 2, 3])
+        self.assertEqual(sock.read_holds, set())
+        self.assertEqual(self.executor.pending(sock), 0)
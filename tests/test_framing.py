@@ -0,0 +1,99 @@
+import unittest
+
+from zokket.framing import (DelimiterCodec, FramingError, FunctionCodec,
+                            LengthPrefixCodec, NetstringCodec, VarintCodec)
+from zokket.tcp import TCPSocket
+
+
+def decode(codec, data):
+    buffer = bytearray(data)
+    frames, consumed = codec.decode(buffer, 0, len(buffer))
+    return [bytes(buffer[start:end]) for start, end in frames], consumed
+
+
+class CodecTest(unittest.TestCase):
+    def test_length_prefix(self):
+        codec = LengthPrefixCodec(width=2)
+        data = b''.join(b''.join(codec.encode(payload)) for payload in (b'ab', b'', b'cde'))
+        self.assertEqual(data, b'\x00\x02ab\x00\x00\x00\x03cde')
+
+        self.assertEqual(decode(codec, data), ([b'ab', b'', b'cde'], len(data)))
+        self.assertEqual(decode(codec, data[:-1]), ([b'ab', b''], 6))
+
+    def test_length_prefix_little_endian(self):
+        codec = LengthPrefixCodec(width=4, byteorder='little')
+        self.assertEqual(decode(codec, b'\x01\x00\x00\x00x\x01'), ([b'x'], 5))
+
+    def test_length_prefix_max_length(self):
+        codec = LengthPrefixCodec(width=1, max_length=2)
+        self.assertRaises(FramingError, decode, codec, b'\x03abc')
+
+    def test_varint(self):
+        codec = VarintCodec()
+        payload = b'x' * 300
+        data = b''.join(codec.encode(payload)) + b'\x01y'
+        self.assertEqual(data[:2], b'\xac\x02')
+
+        self.assertEqual(decode(codec, data), ([payload, b'y'], len(data)))
+        self.assertEqual(decode(codec, data[:1]), ([], 0))
+        self.assertRaises(FramingError, decode, codec, b'\xff' * 10)
+
+    def test_netstring(self):
+        codec = NetstringCodec()
+        self.assertEqual(b''.join(codec.encode(b'hello')), b'5:hello,')
+        self.assertEqual(decode(codec, b'5:hello,0:,3:ab'), ([b'hello', b''], 11))
+        self.assertRaises(FramingError, decode, codec, b'5:hello;')
+        self.assertRaises(FramingError, decode, codec, b'x:')
+
+    def test_delimiter(self):
+        codec = DelimiterCodec(b'\r\n')
+        self.assertEqual(decode(codec, b'a\r\nb\r\nc\r'), ([b'a', b'b'], 6))
+
+        codec = DelimiterCodec(b'\n', include_delimiter=True)
+        self.assertEqual(decode(codec, b'a\nb'), ([b'a\n'], 2))
+
+    def test_function(self):
+        codec = FunctionCodec(lambda data: data[0] if len(data) >= data[0] else None)
+        self.assertEqual(decode(codec, b'\x02a\x03bc\x03d'), ([b'\x02a', b'\x03bc'], 5))
+
+
+class TCPCodecTest(unittest.TestCase):
+    def test_frames_delivered_as_batch(self):
+        batches = []
+
+        class Delegate(object):
+            def socket_read_frames(self, sock, frames):
+                batches.append(frames)
+
+        s = TCPSocket(Delegate())
+        s.codec = LengthPrefixCodec(width=1)
+        s.buffer_type = None
+        s.read_buffer = b'\x01a\x02bc\x03d'
+        s.dispatch_read_buffer()
+
+        self.assertEqual(batches, [[b'a', b'bc']])
+        self.assertEqual(s.read_buffer, b'\x03d')
+
+    def test_frames_fall_back_to_read_data(self):
+        received = []
+
+        class Delegate(object):
+            def socket_read_data(self, sock, data):
+                received.append(data)
+
+        s = TCPSocket(Delegate())
+        s.codec = DelimiterCodec(b'\n')
+        s.read_buffer = b'one\ntwo\n'
+        s.dispatch_read_buffer()
+
+        self.assertEqual(received, ['one', 'two'])
+
+    def test_delimiter_search_resumes(self):
+        s = TCPSocket()
+        s.codec = DelimiterCodec(b'\r\n')
+        s.read_buffer = b'first\r'
+        self.assertEqual(list(s.dequeue_buffer()), [])
+
+        s.read_buffer += b'\nsecond'
+        self.assertEqual(list(s.dequeue_buffer()), [b'first'])
+        self.assertEqual(s.read_buffer, b'second')
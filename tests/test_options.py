@@ -0,0 +1,84 @@
+import socket
+import sys
+import unittest
+
+from zokket.options import SocketOptions, get_profile, profiles, register_profile
+from zokket.runloop import SelectRunloop
+from zokket.tcp import TCPSocket
+
+
+class SocketOptionsTest(unittest.TestCase):
+    def test_listening_options(self):
+        options = SocketOptions(nodelay=True, defer_accept=5)
+        tcp = socket.IPPROTO_TCP
+
+        self.assertEqual(options.socket_options(), [(tcp, socket.TCP_NODELAY, 1)])
+
+        if hasattr(socket, 'TCP_DEFER_ACCEPT'):
+            self.assertEqual(options.socket_options(listening=True), [
+                (tcp, socket.TCP_NODELAY, 1),
+                (tcp, socket.TCP_DEFER_ACCEPT, 5),
+            ])
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'requires Linux')
+    def test_fastopen_connect(self):
+        options = SocketOptions(fastopen=True)
+        self.assertEqual(options.socket_options(), [(socket.IPPROTO_TCP, 30, 1)])
+        self.assertEqual(options.socket_options(accepted=True), [])
+
+    def test_copy(self):
+        options = SocketOptions(nodelay=True, send_buffer=1024)
+        copy = options.copy(nodelay=False)
+
+        self.assertEqual(copy.nodelay, False)
+        self.assertEqual(copy.send_buffer, 1024)
+        self.assertEqual(options.nodelay, True)
+
+    def test_profiles(self):
+        options = SocketOptions(keepalive=True)
+        register_profile('test', options)
+        self.addCleanup(profiles.pop, 'test')
+
+        self.assertTrue(get_profile('test') is options)
+        self.assertTrue(get_profile(options) is options)
+        self.assertRaises(ValueError, get_profile, 'missing')
+
+    def test_accepted_sockets_inherit_options(self):
+        runloop = SelectRunloop()
+        accepted = []
+        connected = []
+
+        class Delegate(object):
+            def socket_did_accept_new_socket(self, sock, new_sock):
+                accepted.append(new_sock)
+
+            def socket_did_connect(self, sock, host, port):
+                connected.append(sock)
+
+        server = TCPSocket(Delegate(), runloop=runloop)
+        server.socket_options = SocketOptions(nodelay=True, keepalive=True,
+                                              fastopen=16, defer_accept=1)
+        server.accept('127.0.0.1', 0)
+
+        client = TCPSocket(Delegate(), runloop=runloop)
+        client.socket_options = 'low-latency'
+        client.connect('127.0.0.1', server.local_port())
+
+        # With TCP_DEFER_ACCEPT the connection is only accepted once data
+        # has arrived.
+        client.send(b'hello')
+
+        for i in range(100):
+            if accepted and connected:
+                break
+            runloop.run_network()
+
+        def option(sock, level, name):
+            return sock.socket.getsockopt(level, name)
+
+        self.assertTrue(option(accepted[0], socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertTrue(option(accepted[0], socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+        self.assertTrue(option(client, socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertFalse(option(client, socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+
+        runloop.shutdown()
@@ -0,0 +1,106 @@
+import socket
+import unittest
+
+from zokket.pool import ConnectionPool, PoolTimeout
+from zokket.runloop import SelectRunloop
+from zokket.tcp import TCPSocket
+
+
+class PoolTest(unittest.TestCase):
+    def setUp(self):
+        self.runloop = SelectRunloop()
+        self.server = TCPSocket(self, runloop=self.runloop)
+        self.server.accept('127.0.0.1', 0)
+        self.port = self.server.local_port()
+        self.accepted = []
+
+        self.pool = ConnectionPool(max_size=1, health_check_interval=None,
+                                   runloop=self.runloop)
+        self.results = []
+
+    def tearDown(self):
+        self.pool.close()
+        self.runloop.shutdown()
+
+    def socket_did_accept_new_socket(self, sock, new_sock):
+        self.accepted.append(new_sock)
+
+    def callback(self, sock, err):
+        self.results.append((sock, err))
+
+    def run_until(self, condition):
+        for i in range(100):
+            if condition():
+                return
+            self.runloop.run_network()
+            self.runloop.run_timers()
+
+    def acquire(self, **kwargs):
+        self.pool.acquire('127.0.0.1', self.port, self.callback, **kwargs)
+        self.run_until(lambda: self.results)
+        return self.results.pop(0)
+
+    def test_connection_is_reused(self):
+        sock, err = self.acquire()
+        self.assertEqual(err, None)
+        self.assertTrue(sock.connected)
+
+        self.pool.release(sock)
+        self.assertEqual(self.pool.idle_count('127.0.0.1', self.port), 1)
+
+        reused, err = self.acquire()
+        self.assertTrue(reused is sock)
+        self.assertEqual(self.pool.size('127.0.0.1', self.port), 1)
+        self.assertEqual(self.pool.idle_count('127.0.0.1', self.port), 0)
+
+    def test_waits_for_released_connection(self):
+        sock, err = self.acquire()
+
+        self.pool.acquire('127.0.0.1', self.port, self.callback, timeout=5)
+        self.assertEqual(self.results, [])
+
+        self.pool.release(sock)
+        self.assertEqual(self.results, [(sock, None)])
+
+    def test_wait_timeout(self):
+        sock, err = self.acquire()
+
+        waiting, err = self.acquire(timeout=0.01)
+        self.assertEqual(waiting, None)
+        self.assertTrue(isinstance(err, PoolTimeout))
+
+    def test_closed_connection_is_not_reused(self):
+        sock, err = self.acquire()
+        self.run_until(lambda: self.accepted)
+
+        self.accepted[0].close()
+        self.run_until(lambda: sock.socket is None)
+        self.pool.release(sock)
+        self.assertEqual(self.pool.size('127.0.0.1', self.port), 0)
+
+        other, err = self.acquire()
+        self.assertFalse(other is sock)
+        self.assertTrue(other.connected)
+
+    def test_idle_timeout(self):
+        sock, err = self.acquire()
+        self.pool.release(sock)
+
+        self.pool.idle_timeout = 0
+        self.pool.check_idle_connections()
+        self.assertEqual(self.pool.size('127.0.0.1', self.port), 0)
+        self.assertEqual(sock.socket, None)
+
+    def test_connection_refused(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        port = listener.getsockname()[1]
+        listener.close()
+
+        self.pool.acquire('127.0.0.1', port, self.callback)
+        self.run_until(lambda: self.results)
+
+        sock, err = self.results[0]
+        self.assertEqual(sock, None)
+        self.assertNotEqual(err, None)
+        self.assertEqual(self.pool.size('127.0.0.1', port), 0)
@@ -0,0 +1,147 @@
+import os
+import select
+import signal
+import sys
+import tempfile
+import time
+import unittest
+
+from zokket.prefork import PreforkServer
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'requires fork')
+class PreforkServerTest(unittest.TestCase):
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+        self.buffer = b''
+        self.supervisor = None
+        self.workers = []
+
+    def tearDown(self):
+        if self.supervisor is not None:
+            os.kill(self.supervisor, signal.SIGKILL)
+            os.waitpid(self.supervisor, 0)
+
+            for pid in self.workers:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+    def start(self, setup=None, **kwargs):
+        """
+        Run a PreforkServer in a forked supervisor, every worker writes its
+        pid to a pipe once it has been set up.
+        """
+
+        def report():
+            if setup is not None:
+                setup()
+            os.write(self.write_fd, '{}\n'.format(os.getpid()).encode('ascii'))
+
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                PreforkServer(report, **kwargs).run()
+                status = 0
+            finally:
+                os._exit(status)
+
+        self.supervisor = pid
+
+    def read_worker(self, timeout=5):
+        deadline = time.time() + timeout
+
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not select.select([self.read_fd], [], [], remaining)[0]:
+                self.fail('Worker was not started')
+            self.buffer += os.read(self.read_fd, 1024)
+
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        self.workers.append(int(line))
+        return self.workers[-1]
+
+    def wait_for_supervisor(self, timeout=5):
+        deadline = time.time() + timeout
+
+        while time.time() < deadline:
+            pid, status = os.waitpid(self.supervisor, os.WNOHANG)
+            if pid:
+                self.supervisor = None
+                return status
+            time.sleep(0.05)
+
+        self.fail('Supervisor did not exit')
+
+    def assertExited(self, pid):
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return
+        self.fail('Worker {} is still running'.format(pid))
+
+    def test_spawns_workers(self):
+        self.start(workers=2)
+
+        workers = set([self.read_worker(), self.read_worker()])
+        self.assertEqual(len(workers), 2)
+        self.assertFalse(self.supervisor in workers)
+
+        os.kill(self.supervisor, signal.SIGTERM)
+        self.assertEqual(self.wait_for_supervisor(), 0)
+
+        for pid in workers:
+            self.assertExited(pid)
+
+    def test_restarts_crashed_worker(self):
+        self.start(workers=1, restart_delay=0)
+
+        crashed = self.read_worker()
+        os.kill(crashed, signal.SIGKILL)
+
+        restarted = self.read_worker()
+        self.assertNotEqual(restarted, crashed)
+
+        os.kill(self.supervisor, signal.SIGTERM)
+        self.assertEqual(self.wait_for_supervisor(), 0)
+
+    def test_graceful_timeout(self):
+        def ignore_stop():
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+        self.start(ignore_stop, workers=1, graceful_timeout=0.5)
+        worker = self.read_worker()
+
+        start = time.time()
+        os.kill(self.supervisor, signal.SIGTERM)
+        self.assertEqual(self.wait_for_supervisor(), 0)
+
+        self.assertTrue(time.time() - start >= 0.5)
+        self.assertExited(worker)
+
+    def test_worker_exception_is_printed(self):
+        stderr = tempfile.TemporaryFile()
+        self.addCleanup(stderr.close)
+
+        def crash():
+            sys.stderr = os.fdopen(os.dup(stderr.fileno()), 'w')
+            raise RuntimeError('broken setup')
+
+        self.start(crash, workers=1, restart_delay=0.1)
+
+        deadline = time.time() + 5
+        output = b''
+        while b'broken setup' not in output and time.time() < deadline:
+            time.sleep(0.05)
+            stderr.seek(0)
+            output = stderr.read()
+
+        os.kill(self.supervisor, signal.SIGTERM)
+        self.wait_for_supervisor()
+
+        self.assertTrue(b'RuntimeError: broken setup' in output)
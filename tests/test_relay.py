@@ -0,0 +1,78 @@
+import socket
+import unittest
+
+from zokket.relay import TCPRelay
+from zokket.runloop import SelectRunloop
+from zokket.tcp import TCPSocket
+
+
+class RelayTest(unittest.TestCase):
+    def setUp(self):
+        self.runloop = SelectRunloop()
+
+    def connected_pair(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+
+        client = socket.create_connection(listener.getsockname())
+        server, address = listener.accept()
+        listener.close()
+
+        sock = TCPSocket(runloop=self.runloop)
+        sock.socket = server
+        sock.socket.setblocking(0)
+        sock.connected = True
+        self.runloop.register_socket(sock)
+
+        return client, sock
+
+    def run_until(self, condition):
+        for i in range(1000):
+            if condition():
+                return
+            self.runloop.run_network()
+
+    def relay(self, splice):
+        left, first = self.connected_pair()
+        right, second = self.connected_pair()
+
+        first.read_buffer = b'early:'
+        relay = TCPRelay(first, second)
+        for direction in relay.directions:
+            direction.use_splice = direction.use_splice and splice
+
+        payload = b'x' * 1000000
+        left.sendall(payload)
+        left.shutdown(socket.SHUT_WR)
+
+        received = []
+        right.setblocking(0)
+
+        def receive():
+            while True:
+                try:
+                    data = right.recv(65536)
+                except socket.error:
+                    return False
+                received.append(data)
+                if not data:
+                    return True
+
+        self.run_until(receive)
+
+        self.assertEqual(b''.join(received), b'early:' + payload)
+        self.assertEqual(first.downloaded_bytes, len(payload))
+        self.assertEqual(second.uploaded_bytes, len(payload) + 6)
+
+        right.close()
+        self.run_until(lambda: first.socket is None and second.socket is None)
+        self.assertEqual(first.socket, None)
+        self.assertEqual(second.socket, None)
+        left.close()
+
+    def test_relay(self):
+        self.relay(splice=True)
+
+    def test_relay_without_splice(self):
+        self.relay(splice=False)
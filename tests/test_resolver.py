@@ -0,0 +1,139 @@
+import socket
+import threading
+import unittest
+
+from zokket.resolver import Resolver, is_ip_address
+from zokket.runloop import SelectRunloop
+from zokket.tcp import TCPSocket
+
+
+class CountingResolver(Resolver):
+    def __init__(self, **kwargs):
+        Resolver.__init__(self, **kwargs)
+        self.lookups = []
+        self.unblock = threading.Event()
+        self.unblock.set()
+
+    def lookup(self, host, port, family):
+        self.lookups.append(host)
+        self.unblock.wait(5)
+
+        if host == 'missing.invalid':
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return [(socket.AF_INET, ('127.0.0.1', port))]
+
+
+class ResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.runloop = SelectRunloop()
+        self.runloop.waker.runloop = self.runloop
+        self.runloop.register_socket(self.runloop.waker)
+        self.resolver = CountingResolver()
+        self.results = []
+
+    def tearDown(self):
+        self.resolver.shutdown()
+        self.runloop.shutdown()
+
+    def callback(self, addresses, err):
+        self.results.append((addresses, err))
+
+    def resolve(self, host, count=1):
+        self.results = []
+        self.resolver.unblock.clear()
+
+        for i in range(count):
+            self.resolver.resolve(host, 80, self.callback, runloop=self.runloop)
+
+        self.resolver.unblock.set()
+
+        for i in range(100):
+            if len(self.results) >= count:
+                break
+            self.runloop.run_network()
+            self.runloop.run_callbacks()
+
+    def test_is_ip_address(self):
+        self.assertTrue(is_ip_address('127.0.0.1'))
+        self.assertTrue(is_ip_address('::1'))
+        self.assertFalse(is_ip_address('localhost'))
+
+    def test_concurrent_lookups_are_coalesced(self):
+        self.resolve('example.test', count=3)
+
+        self.assertEqual(self.resolver.lookups, ['example.test'])
+        self.assertEqual(self.results, [([(socket.AF_INET, ('127.0.0.1', 80))], None)] * 3)
+
+    def test_results_are_cached(self):
+        self.resolve('example.test')
+        self.resolve('example.test', count=2)
+        self.assertEqual(self.resolver.lookups, ['example.test'])
+
+        self.resolver.clear()
+        self.resolve('example.test', count=3)
+        self.assertEqual(self.resolver.lookups, ['example.test'] * 2)
+
+    def test_failures_are_cached(self):
+        self.resolve('missing.invalid')
+        self.assertEqual(self.results[0][0], None)
+        self.assertTrue(isinstance(self.results[0][1], socket.gaierror))
+
+        self.resolve('missing.invalid', count=2)
+        self.assertEqual(self.resolver.lookups, ['missing.invalid'])
+
+        self.resolver.negative_ttl = 0
+        self.resolver.clear()
+        self.resolve('missing.invalid', count=3)
+        self.resolve('missing.invalid', count=4)
+        self.assertEqual(self.resolver.lookups, ['missing.invalid'] * 3)
+
+    def test_connect_resolves_host(self):
+        connected = []
+
+        class Delegate(object):
+            def socket_did_connect(self, sock, host, port):
+                connected.append(port)
+
+        server = TCPSocket(Delegate(), runloop=self.runloop)
+        server.accept('127.0.0.1', 0)
+
+        client = TCPSocket(Delegate(), runloop=self.runloop)
+        client.resolver = self.resolver
+        client.connect('example.test', server.local_port())
+        self.assertTrue(client.resolving)
+
+        for i in range(100):
+            if connected:
+                break
+            self.runloop.run_network()
+            self.runloop.run_callbacks()
+
+        self.assertEqual(connected, [server.local_port()])
+        self.assertEqual(self.resolver.lookups, ['example.test'])
+
+    def test_send_while_resolving(self):
+        received = []
+
+        class Delegate(object):
+            def socket_read_data(self, sock, data):
+                received.append(data)
+
+        server = TCPSocket(Delegate(), runloop=self.runloop)
+        server.accept('127.0.0.1', 0)
+
+        self.resolver.unblock.clear()
+
+        client = TCPSocket(runloop=self.runloop)
+        client.resolver = self.resolver
+        client.connect('example.test', server.local_port())
+        self.assertEqual(client.send(b'hello'), 5)
+
+        self.resolver.unblock.set()
+
+        for i in range(100):
+            if received:
+                break
+            self.runloop.run_network()
+            self.runloop.run_callbacks()
+
+        self.assertEqual(received, ['hello'])
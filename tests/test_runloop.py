@@ -0,0 +1,249 @@
+import select
+import socket
+import threading
+import time
+import unittest
+
+from zokket.group import RunloopGroup
+from zokket.runloop import EpollRunloop, PollRunloop, SelectRunloop
+from zokket.tcp import TCPSocket
+from zokket.timers import Timer
+
+
+class FakeSocket(object):
+    def __init__(self, sock):
+        self.socket = sock
+        self.events = []
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def handle_read_event(self):
+        self.events.append(self.socket.recv(1024))
+
+    def handle_write_event(self):
+        self.events.append('write')
+
+    def handle_except_event(self):
+        pass
+
+
+@unittest.skipUnless(hasattr(select, 'epoll'), 'epoll is not available')
+class EpollRunloopTest(unittest.TestCase):
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_dispatches_by_fd(self):
+        runloop = EpollRunloop()
+        sock = FakeSocket(self.left)
+        runloop.register_socket(sock)
+        self.assertEqual(list(runloop.sockets), [sock])
+
+        self.right.send(b'hello')
+        runloop.run_network()
+        self.assertEqual(sock.events, [b'hello'])
+
+        runloop.unregister_socket(sock)
+        self.assertEqual(len(runloop.sockets), 0)
+
+    def test_update_socket_changes_interest(self):
+        runloop = EpollRunloop()
+        sock = FakeSocket(self.left)
+        runloop.register_socket(sock)
+
+        sock.writable = lambda: True
+        runloop.update_socket(sock)
+        runloop.run_network()
+        self.assertEqual(sock.events, ['write'])
+
+    def test_edge_triggered(self):
+        runloop = EpollRunloop(edge_triggered=True)
+        self.assertTrue(runloop.eventmask(FakeSocket(self.left)) & select.EPOLLET)
+
+
+@unittest.skipUnless(hasattr(select, 'poll'), 'poll is not available')
+class PollRunloopTest(unittest.TestCase):
+    def test_read_and_write_in_one_iteration(self):
+        left, right = socket.socketpair()
+        self.addCleanup(left.close)
+        self.addCleanup(right.close)
+
+        runloop = PollRunloop()
+        sock = FakeSocket(left)
+        sock.writable = lambda: True
+        runloop.register_socket(sock)
+
+        right.send(b'hello')
+        runloop.run_network()
+        self.assertEqual(sock.events, [b'hello', 'write'])
+
+
+class ShutdownTest(unittest.TestCase):
+    def test_shutdown_timeout(self):
+        left, right = socket.socketpair()
+        self.addCleanup(right.close)
+        errors = []
+
+        class Delegate(object):
+            def socket_did_disconnect(self, sock, err=None):
+                errors.append(err)
+
+        runloop = SelectRunloop()
+        runloop.shutdown_timeout = 0.1
+
+        sock = TCPSocket(Delegate(), runloop=runloop)
+        sock.socket = left
+        sock.socket.setblocking(0)
+        sock.connected = True
+        runloop.register_socket(sock)
+
+        # The peer never reads, the data can't all be written.
+        sock.send(b'x' * 16 * 1024 * 1024)
+
+        runloop.call_soon(runloop.stop)
+        runloop.run()
+
+        self.assertEqual(sock.socket, None)
+        self.assertTrue(isinstance(errors[0], TimeoutError))
+
+
+class TimerRunloopTest(unittest.TestCase):
+    def setUp(self):
+        self.runloop = SelectRunloop()
+        self.fired = []
+
+    def callback(self, timer):
+        self.fired.append(timer.data)
+
+    def test_timers_fire_in_deadline_order(self):
+        Timer(0.02, self.callback, data='late', runloop=self.runloop)
+        Timer(0, self.callback, data='early', runloop=self.runloop)
+        Timer(60, self.callback, data='never', runloop=self.runloop)
+
+        time.sleep(0.03)
+        self.runloop.run_timers()
+
+        self.assertEqual(self.fired, ['early', 'late'])
+        self.assertEqual(len(self.runloop.timers), 1)
+
+    def test_invalidated_timer_does_not_fire(self):
+        timer = Timer(0, self.callback, data='cancelled', runloop=self.runloop)
+        timer.invalidate()
+
+        self.runloop.run_timers()
+        self.assertEqual(self.fired, [])
+        self.assertEqual(self.runloop.timer_timeout(), 180)
+
+    def test_repeating_timer_is_rescheduled(self):
+        timer = Timer(0, self.callback, repeat=True, data='tick', runloop=self.runloop)
+
+        self.runloop.run_timers()
+        self.runloop.run_timers()
+        self.assertEqual(self.fired, ['tick', 'tick'])
+
+        timer.invalidate()
+        self.runloop.run_timers()
+        self.assertEqual(self.fired, ['tick', 'tick'])
+
+
+class AdoptedSocket(object):
+    def __init__(self):
+        self.runloop = None
+        self.configured = False
+
+    def configure(self):
+        self.configured = True
+
+
+class RunloopGroupTest(unittest.TestCase):
+    def test_round_robin(self):
+        group = RunloopGroup(2)
+        sockets = [AdoptedSocket() for i in range(3)]
+        [group.adopt_socket(sock) for sock in sockets]
+        self.assertFalse(any(s.configured for s in sockets))
+
+        [runloop.run_callbacks() for runloop in group.runloops]
+
+        runloops = group.runloops
+        self.assertEqual([s.runloop for s in sockets], [runloops[0], runloops[1], runloops[0]])
+        self.assertTrue(all(s.configured for s in sockets))
+
+
+class CallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.runloop = SelectRunloop()
+        self.called = []
+
+    def test_call_soon(self):
+        self.runloop.call_soon(self.called.append, 1)
+        self.assertEqual(self.runloop.poll_timeout(), 0)
+
+        self.runloop.run_callbacks()
+        self.assertEqual(self.called, [1])
+        self.assertEqual(self.runloop.poll_timeout(), 180)
+
+    def test_callbacks_scheduled_by_callbacks_run_next_iteration(self):
+        self.runloop.call_soon(self.runloop.call_soon, self.called.append, 2)
+
+        self.runloop.run_callbacks()
+        self.assertEqual(self.called, [])
+
+        self.runloop.run_callbacks()
+        self.assertEqual(self.called, [2])
+
+    def test_call_soon_threadsafe_wakes_runloop(self):
+        thread = threading.Thread(target=self.runloop.run)
+        thread.start()
+
+        self.runloop.call_soon_threadsafe(self.called.append, 3)
+        self.runloop.call_soon_threadsafe(self.runloop.stop)
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.called, [3])
+
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+        self.runloop = SelectRunloop()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_records_handlers_and_ready_sockets(self):
+        instrumentation = self.runloop.enable_instrumentation(slow_callback_threshold=60)
+        sock = FakeSocket(self.left)
+        self.runloop.register_socket(sock)
+
+        self.right.send(b'hello')
+        self.runloop.run_network()
+
+        snapshot = instrumentation.snapshot()
+        self.assertEqual(snapshot['handlers']['FakeSocket.handle_read_event']['count'], 1)
+        self.assertEqual(snapshot['ready_sockets']['count'], 1)
+        self.assertEqual(snapshot['ready_sockets']['max'], 1)
+        self.assertEqual(snapshot['slow_callbacks'], 0)
+
+    def test_records_timer_lateness_and_slow_callbacks(self):
+        instrumentation = self.runloop.enable_instrumentation(slow_callback_threshold=0)
+        Timer(0, lambda timer: None, runloop=self.runloop)
+
+        self.runloop.run_timers()
+
+        self.assertEqual(instrumentation.timer_lateness.count, 1)
+        self.assertEqual(instrumentation.slow_callbacks, 1)
+
+    def test_disabled_by_default(self):
+        self.assertEqual(self.runloop.instrumentation, None)
@@ -0,0 +1,122 @@
+import socket
+import threading
+import time
+import unittest
+
+from zokket import shaping
+from zokket.shaping import RateLimiter, TokenBucket, set_global_limiter
+from zokket.runloop import SelectRunloop
+from zokket.tcp import TCPSocket
+from zokket.udp import UDPSocket
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_consume_and_refill(self):
+        bucket = TokenBucket(1000, burst=500)
+        self.assertEqual(bucket.available(), 500)
+
+        bucket.consume(700)
+        self.assertEqual(bucket.available(), 0)
+        self.assertAlmostEqual(bucket.delay(100), 0.3, places=2)
+
+        bucket.updated -= 1
+        self.assertEqual(bucket.available(), 500)
+
+    def test_allowance(self):
+        group = RateLimiter(upload=100000, quantum=4096)
+        limiter = RateLimiter(upload=1000, download=100000)
+
+        self.assertEqual(shaping.allowance([group], shaping.UPLOAD), 4096)
+        self.assertEqual(shaping.allowance([group, limiter], shaping.UPLOAD, 8192), 1000)
+        self.assertEqual(shaping.allowance([group], shaping.DOWNLOAD, 10), 10)
+
+    def test_global_limiter(self):
+        limiter = RateLimiter(download=1000)
+        set_global_limiter(limiter)
+        self.addCleanup(set_global_limiter, None)
+
+        sock = TCPSocket()
+        self.assertEqual(sock.rate_allowance(shaping.DOWNLOAD, 8192), 1000)
+        self.assertEqual(sock.rate_allowance(shaping.UPLOAD), None)
+
+
+class ShapingTest(unittest.TestCase):
+    def setUp(self):
+        self.runloop = SelectRunloop()
+        self.received = bytearray()
+
+        self.server = TCPSocket(self, runloop=self.runloop)
+        self.server.accept('127.0.0.1', 0)
+
+    def tearDown(self):
+        self.runloop.shutdown()
+
+    def socket_did_accept_new_socket(self, sock, new_sock):
+        new_sock.rate_limiters = [RateLimiter(upload=100 * 1024, burst=8 * 1024,
+                                              quantum=4096)]
+        new_sock.send(b'x' * 32 * 1024)
+
+    def socket_read_data(self, sock, data):
+        self.received.extend(data.encode('utf-8'))
+
+    def test_upload_is_shaped(self):
+        client = TCPSocket(self, runloop=self.runloop)
+        client.connect('127.0.0.1', self.server.local_port())
+
+        start = time.time()
+
+        for i in range(1000):
+            if len(self.received) >= 32 * 1024:
+                break
+            self.runloop.run_network()
+            self.runloop.run_timers()
+
+        # 8KB burst, then 24KB at 100KB/s.
+        self.assertEqual(len(self.received), 32 * 1024)
+        self.assertTrue(time.time() - start >= 0.2)
+
+    def test_udp_datagrams_are_queued(self):
+        sock = UDPSocket(runloop=self.runloop)
+        sock.rate_limiters = [RateLimiter(upload=1000)]
+        sock.bind('127.0.0.1', 0)
+        port = sock.socket.getsockname()[1]
+
+        for i in range(3):
+            sock.send('127.0.0.1', port, b'x' * 600)
+
+        self.assertEqual(sock.uploaded_bytes, 1200)
+        self.assertEqual(len(sock.send_queue), 1)
+        self.assertNotEqual(sock.write_throttle, None)
+        sock.close()
+
+    def test_queued_data_is_written_after_stop(self):
+        left, right = socket.socketpair()
+        self.addCleanup(right.close)
+        received = bytearray()
+
+        def read():
+            while True:
+                data = right.recv(65536)
+                if not data:
+                    break
+                received.extend(data)
+
+        reader = threading.Thread(target=read)
+        reader.start()
+
+        sock = TCPSocket(runloop=self.runloop)
+        sock.socket = left
+        sock.socket.setblocking(0)
+        sock.connected = True
+        sock.rate_limiters = [RateLimiter(upload=100 * 1024, burst=8 * 1024,
+                                          quantum=4096)]
+        self.runloop.register_socket(sock)
+
+        sock.send(b'x' * 32 * 1024)
+        sock.close()
+
+        self.runloop.call_soon(self.runloop.stop)
+        self.runloop.run()
+        reader.join(5)
+
+        self.assertEqual(len(received), 32 * 1024)
@@ -1,6 +1,10 @@
+import errno
+import socket
+import tempfile
 import unittest
+from unittest import mock
 
-from zokket.tcp import TCPSocket
+from zokket.tcp import FileTransfer, SocketException, TCPSocket
 
 
 class TCPTest(unittest.TestCase):
@@ -47,3 +51,407 @@ class TCPTest(unittest.TestCase):
         self.assertEqual(next(read_buffer), b'more')
         self.assertRaises(StopIteration, next, read_buffer)
 
+
+    def test_delimiter_split_across_reads(self):
+        s = TCPSocket()
+        s.read_until_data = b'\r\n'
+        s.read_buffer = b'first\r'
+
+        self.assertEqual(list(s.dequeue_buffer()), [])
+
+        s.reserve_read_buffer(8)
+        s.read_storage[s.read_end:s.read_end + 8] = b'\nsecond\r'
+        s.read_end += 8
+        self.assertEqual(list(s.dequeue_buffer()), [b'first\r\n'])
+        self.assertEqual(s.read_buffer, b'second\r')
+
+    def test_reserve_read_buffer_compacts(self):
+        s = TCPSocket()
+        s.read_until_length = 4
+        s.read_buffer = b'123456'
+        self.assertEqual(list(s.dequeue_buffer()), [b'1234'])
+
+        s.reserve_read_buffer(len(s.read_storage) - 2)
+        self.assertEqual(s.read_start, 0)
+        self.assertEqual(s.read_buffer, b'56')
+
+    def test_read_as_memoryview(self):
+        received = []
+
+        class Delegate(object):
+            def socket_read_data(self, sock, data):
+                received.append((type(data), data.tobytes()))
+
+        s = TCPSocket(Delegate())
+        s.read_as_memoryview = True
+        s.read_until_data = b'\n'
+        s.read_buffer = b'a\nb\n'
+        s.dispatch_read_buffer()
+
+        self.assertEqual(received, [(memoryview, b'a\n'), (memoryview, b'b\n')])
+
+
+class FakeRunloop(object):
+    def register_socket(self, sock):
+        pass
+
+    def update_socket(self, sock):
+        pass
+
+    def unregister_socket(self, sock):
+        pass
+
+
+class FakeSocket(object):
+    def __init__(self, limit):
+        self.limit = limit
+        self.sent = b''
+        self.calls = 0
+
+    def send(self, data):
+        if self.limit == 0:
+            raise socket.error(errno.EWOULDBLOCK, 'would block')
+
+        data = bytes(data[:self.limit])
+        self.limit -= len(data)
+        self.sent += data
+        return len(data)
+
+    def sendmsg(self, buffers):
+        self.calls += 1
+        return self.send(b''.join(bytes(b) for b in buffers))
+
+    def close(self):
+        pass
+
+
+class Delegate(object):
+    def __init__(self):
+        self.events = []
+
+    def socket_write_buffer_full(self, sock):
+        self.events.append('full')
+
+    def socket_write_buffer_drained(self, sock):
+        self.events.append('drained')
+
+
+class TCPReadFlowTest(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.events = []
+        self.sock = TCPSocket(self, runloop=FakeRunloop())
+        self.sock.socket = FakeSocket(0)
+        self.sock.connected = True
+        self.sock.buffer_type = None
+        self.sock.read_until_data = b'\n'
+
+    def socket_read_data(self, sock, data):
+        self.received.append(data)
+        if data == b'pause\n':
+            sock.pause_reading()
+
+    def socket_read_buffer_full(self, sock):
+        self.events.append('full')
+
+    def test_pause_stops_dispatch(self):
+        self.sock.read_buffer = b'pause\nb\nc\n'
+        self.sock.dispatch_read_buffer()
+
+        self.assertEqual(self.received, [b'pause\n'])
+        self.assertTrue(self.sock.reading_paused)
+        self.assertFalse(self.sock.readable())
+
+        self.sock.resume_reading()
+
+        self.assertEqual(self.received, [b'pause\n', b'b\n', b'c\n'])
+        self.assertTrue(self.sock.readable())
+
+    def test_read_buffer_limit(self):
+        self.sock.read_buffer_limit = 4
+        self.sock.read_buffer = b'abcdef'
+        self.sock.dispatch_read_buffer()
+
+        self.assertEqual(self.events, ['full'])
+        self.assertFalse(self.sock.readable())
+
+        self.sock.read_until_data = None
+        self.sock.resume_reading()
+
+        self.assertEqual(self.received, [b'abcdef'])
+        self.assertTrue(self.sock.readable())
+
+
+class TCPWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.delegate = Delegate()
+        self.s = TCPSocket(self.delegate, runloop=FakeRunloop())
+        self.s.socket = FakeSocket(limit=4)
+        self.s.connected = True
+
+    def test_partial_write_is_queued(self):
+        self.s.send(b'hello world')
+
+        self.assertEqual(self.s.socket.sent, b'hell')
+        self.assertEqual(self.s.uploaded_bytes, 4)
+        self.assertEqual(self.s.write_buffer_size, 7)
+        self.assertTrue(self.s.writable())
+
+        self.s.socket.limit = 100
+        self.s.handle_write_event()
+
+        self.assertEqual(self.s.socket.sent, b'hello world')
+        self.assertEqual(self.s.uploaded_bytes, 11)
+        self.assertFalse(self.s.writable())
+
+    def test_vectored_write_advances_across_buffers(self):
+        self.s.socket.limit = 0
+        self.s.send([b'head', bytearray(b'er'), memoryview(b'body')])
+        self.assertEqual(len(self.s.write_queue), 3)
+
+        self.s.socket.limit = 7
+        self.s.socket.calls = 0
+        self.s.handle_write_event()
+        self.assertEqual(self.s.socket.sent, b'headerb')
+        self.assertEqual(self.s.socket.calls, 1)
+        self.assertEqual([bytes(b) for b in self.s.write_queue], [b'ody'])
+
+        self.s.socket.limit = 100
+        self.s.handle_write_event()
+        self.assertEqual(self.s.socket.sent, b'headerbody')
+        self.assertEqual(self.s.uploaded_bytes, 10)
+
+    def test_auto_cork_gathers_sends(self):
+        callbacks = []
+        self.s.runloop.call_soon = lambda callback: callbacks.append(callback)
+        self.s.socket.limit = 100
+        self.s.auto_cork = True
+
+        self.s.send(b'one')
+        self.s.send(b'two')
+        self.assertEqual(self.s.socket.sent, b'')
+        self.assertEqual(len(callbacks), 1)
+
+        callbacks[0]()
+        self.assertEqual(self.s.socket.sent, b'onetwo')
+        self.assertEqual(self.s.socket.calls, 1)
+
+    def test_auto_cork_threshold(self):
+        self.s.runloop.call_soon = lambda callback: None
+        self.s.socket.limit = 100
+        self.s.auto_cork = True
+        self.s.cork_threshold = 4
+
+        self.s.send(b'one')
+        self.s.send(b'two')
+        self.assertEqual(self.s.socket.sent, b'onetwo')
+
+    def test_watermarks(self):
+        self.s.write_buffer_high_watermark = 8
+        self.s.write_buffer_low_watermark = 2
+
+        self.s.send(b'0123456789ab')
+        self.assertEqual(self.delegate.events, ['full'])
+
+        self.s.socket.limit = 5
+        self.s.handle_write_event()
+        self.assertEqual(self.delegate.events, ['full'])
+
+        self.s.socket.limit = 100
+        self.s.handle_write_event()
+        self.assertEqual(self.delegate.events, ['full', 'drained'])
+
+    def test_close_waits_for_queued_data(self):
+        self.s.send(b'hello world')
+        self.s.close()
+        self.assertTrue(self.s.socket is not None)
+
+        self.s.socket.limit = 100
+        self.s.handle_write_event()
+        self.assertTrue(self.s.socket is None)
+
+
+class AbortingSocket(object):
+    """
+    A listening socket whose first pending connection was reset by the
+    peer before it could be accepted.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.aborted = False
+
+    def accept(self):
+        if not self.aborted:
+            self.aborted = True
+            raise socket.error(errno.ECONNABORTED, 'connection aborted')
+        return self.sock.accept()
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+class TCPAcceptTest(unittest.TestCase):
+    def setUp(self):
+        self.accepted = []
+        self.clients = []
+
+        self.server = TCPSocket(self, runloop=FakeRunloop())
+        self.server.accept('127.0.0.1', 0)
+
+    def tearDown(self):
+        for sock in self.accepted:
+            sock.close()
+        for client in self.clients:
+            client.close()
+        self.server.close()
+
+    def socket_did_accept_new_socket(self, sock, new_sock):
+        self.accepted.append(new_sock)
+
+    def connect(self, count):
+        for i in range(count):
+            client = socket.create_connection(('127.0.0.1', self.server.local_port()))
+            self.clients.append(client)
+
+    def test_backlog(self):
+        server = TCPSocket(self, runloop=FakeRunloop())
+
+        with mock.patch.object(socket.socket, 'listen') as listen:
+            server.accept('127.0.0.1', 0, backlog=5)
+
+        listen.assert_called_once_with(5)
+        server.close()
+
+    def test_drains_pending_connections(self):
+        self.connect(5)
+        self.server.handle_read_event()
+
+        self.assertEqual(len(self.accepted), 5)
+        self.assertTrue(all(sock.accepted for sock in self.accepted))
+
+        # Nothing is pending, the listening socket would block.
+        self.server.handle_read_event()
+        self.assertEqual(len(self.accepted), 5)
+
+    def test_accept_budget(self):
+        self.server.accept_budget = 3
+        self.connect(5)
+
+        self.server.handle_read_event()
+        self.assertEqual(len(self.accepted), 3)
+
+        self.server.handle_read_event()
+        self.assertEqual(len(self.accepted), 5)
+
+    def test_aborted_connection_is_skipped(self):
+        self.connect(2)
+        listening = self.server.socket
+        self.server.socket = AbortingSocket(listening)
+
+        self.server.handle_read_event()
+        self.server.socket = listening
+
+        self.assertEqual(len(self.accepted), 2)
+
+
+class TCPSendFileTest(unittest.TestCase):
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+        self.left.setblocking(0)
+
+        self.sent_files = []
+        self.s = TCPSocket(self, runloop=FakeRunloop())
+        self.s.socket = self.left
+        self.s.connected = True
+
+        self.file = tempfile.TemporaryFile()
+        self.file.write(b'0123456789' * 1000)
+        self.file.flush()
+
+    def tearDown(self):
+        self.file.close()
+        self.right.close()
+        self.s.close()
+
+    def socket_did_send_file(self, sock, fileobj):
+        self.sent_files.append(fileobj)
+
+    def receive(self, size):
+        data = b''
+        while len(data) < size:
+            data += self.right.recv(size - len(data))
+        return data
+
+    def test_send_file(self):
+        self.s.send(b'head:')
+        self.s.send_file(self.file, offset=10, count=20)
+
+        self.assertEqual(self.receive(25), b'head:01234567890123456789')
+        self.assertEqual(self.sent_files, [self.file])
+        self.assertEqual(self.s.uploaded_bytes, 25)
+
+    def test_send_file_without_sendfile(self):
+        transfer = FileTransfer(self.file)
+        transfer.use_sendfile = False
+        transfer.chunk_size = 4096
+
+        self.s.write_queue.append(transfer)
+        self.s.flush()
+
+        self.assertEqual(self.receive(10000), b'0123456789' * 1000)
+        self.assertEqual(self.sent_files, [self.file])
+        self.assertEqual(self.s.write_buffer_size, 0)
+
+
+class TCPSpillTest(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.sock = TCPSocket(self)
+        self.sock.runloop = FakeRunloop()
+        self.sock.socket, self.peer = socket.socketpair()
+        self.sock.socket.setblocking(0)
+        self.sock.connected = True
+        self.sock.buffer_type = None
+        self.sock.spill_threshold = 16
+        self.sock.read_until_length = 100
+
+    def tearDown(self):
+        self.sock.close(SocketException('done'))
+        self.peer.close()
+
+    def socket_read_data(self, sock, data):
+        self.received.append(data)
+
+    def socket_read_spilled_data(self, sock, spill):
+        with spill.memoryview() as data:
+            self.received.append(data.tobytes())
+        spill.file.seek(0)
+        self.received.append(spill.file.read())
+        spill.close()
+
+    def test_large_frame_is_spilled(self):
+        payload = bytes(bytearray(range(100)))
+
+        self.peer.sendall(payload[:30])
+        self.sock.bytes_availible()
+        self.assertNotEqual(self.sock.spill, None)
+        self.assertEqual(self.sock.spill.received, 30)
+        self.assertEqual(self.sock.read_buffer, b'')
+
+        self.peer.sendall(payload[30:] + b'next')
+        self.sock.bytes_availible()
+        self.assertEqual(self.received, [payload, payload])
+        self.assertEqual(self.sock.spill, None)
+
+        self.sock.read_until_length = 4
+        self.sock.bytes_availible()
+        self.assertEqual(self.received[2:], [b'next'])
+
+    def test_small_frame_is_not_spilled(self):
+        self.sock.read_until_length = 8
+        self.peer.sendall(b'12345678')
+        self.sock.bytes_availible()
+
+        self.assertEqual(self.sock.spill, None)
+        self.assertEqual(self.received, [b'12345678'])
@@ -0,0 +1,215 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+from zokket.runloop import SelectRunloop
+from zokket.tcp import TCPSocket
+from zokket.tls import TLSCache
+
+
+@unittest.skipUnless(ssl and shutil.which('openssl'), 'requires ssl and openssl')
+class TLSTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.keyfile = os.path.join(cls.directory, 'key.pem')
+        cls.certfile = os.path.join(cls.directory, 'cert.pem')
+
+        subprocess.check_call([
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+            '-keyout', cls.keyfile, '-out', cls.certfile, '-days', '1',
+            '-subj', '/CN=localhost',
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.runloop = SelectRunloop()
+        self.server_cache = TLSCache()
+        self.client_cache = TLSCache()
+        self.events = []
+
+        self.server = TCPSocket(self, runloop=self.runloop)
+        self.server.accept('127.0.0.1', 0)
+
+    def tearDown(self):
+        self.runloop.shutdown()
+
+    # Server delegate
+
+    def socket_did_accept_new_socket(self, sock, new_sock):
+        new_sock.delegate = Server()
+        new_sock.tls_cache = self.server_cache
+        new_sock.start_tls(keyfile=self.keyfile, certfile=self.certfile)
+
+    def connect(self):
+        client = TCPSocket(Client(self.events), runloop=self.runloop)
+        client.tls_cache = self.client_cache
+        client.connect('127.0.0.1', self.server.local_port())
+
+        for i in range(200):
+            if 'disconnect' in self.events:
+                break
+            self.runloop.run_network()
+
+        events, self.events[:] = list(self.events), []
+        return events
+
+    def test_session_is_resumed(self):
+        self.assertEqual(self.connect(), [('secure', False), 'hello', 'disconnect'])
+        self.assertEqual(self.connect(), [('secure', True), 'hello', 'disconnect'])
+
+        self.assertEqual(self.client_cache.statistics(), {
+            'contexts': 1,
+            'sessions': 1,
+            'handshakes': 2,
+            'resumed_handshakes': 1,
+        })
+        self.assertEqual(self.server_cache.statistics()['resumed_handshakes'], 1)
+
+    def run_until(self, condition):
+        for i in range(500):
+            if condition():
+                return
+            self.runloop.run_network()
+
+    def test_decrypts_all_pending_data(self):
+        client = TCPSocket(Echo(), runloop=self.runloop)
+        client.tls_cache = self.client_cache
+        client.read_chunk_size = 1024
+        client.data = bytearray()
+        client.connect('127.0.0.1', self.server.local_port())
+
+        self.run_until(lambda: len(client.data) >= 64 * 1000)
+
+        # Sent while the handshake was running, then encrypted in batches.
+        self.assertEqual(bytes(client.data), b'x' * 1000 * 64)
+        self.assertEqual(client.tls.pending(), 0)
+        client.close()
+
+    def test_stop_tls(self):
+        client = TCPSocket(Cleartext(), runloop=self.runloop)
+        client.tls_cache = self.client_cache
+        client.data = bytearray()
+        client.connect('127.0.0.1', self.server.local_port())
+
+        self.run_until(lambda: client.data == b'plain')
+
+        self.assertEqual(client.tls, None)
+        self.assertEqual(bytes(client.data), b'plain')
+        client.close()
+
+    def test_close_during_handshake(self):
+        received = []
+
+        class Receiver(object):
+            def socket_read_data(self, sock, data):
+                received.append(data)
+
+        self.server.delegate = Acceptor(self, Receiver())
+
+        client = TCPSocket(Closing(self.events), runloop=self.runloop)
+        client.tls_cache = self.client_cache
+        client.connect('127.0.0.1', self.server.local_port())
+
+        self.run_until(lambda: received and 'disconnect' in self.events)
+
+        self.assertEqual(received, ['bye'])
+        self.assertEqual(self.events, ['disconnect'])
+        self.assertEqual(client.socket, None)
+
+    def test_contexts_are_shared(self):
+        first = self.server_cache.context(True, self.keyfile, self.certfile)
+        second = self.server_cache.context(True, self.keyfile, self.certfile)
+        client = self.server_cache.context(False)
+
+        self.assertTrue(first is second)
+        self.assertFalse(first is client)
+
+
+class Server(object):
+    def socket_did_secure(self, sock):
+        sock.send(b'hello')
+
+    def socket_read_data(self, sock, data):
+        if data == 'CCC':
+            sock.stop_tls()
+            sock.send(b'plain')
+        else:
+            sock.send(data)
+
+
+class Client(object):
+    def __init__(self, events):
+        self.events = events
+
+    def socket_did_connect(self, sock, host, port):
+        sock.start_tls()
+
+    def socket_did_secure(self, sock):
+        self.events.append(('secure', sock.tls.sslobj.session_reused))
+
+    def socket_read_data(self, sock, data):
+        self.events.append(data)
+        sock.close()
+
+    def socket_did_disconnect(self, sock, err=None):
+        self.events.append('disconnect')
+
+
+class Echo(object):
+    def socket_did_connect(self, sock, host, port):
+        sock.start_tls()
+
+        for i in range(64):
+            sock.send(b'x' * 1000)
+
+    def socket_read_data(self, sock, data):
+        if data != 'hello':
+            sock.data.extend(data.encode('utf-8'))
+            assert sock.tls.pending() == 0
+
+
+class Cleartext(object):
+    def socket_did_connect(self, sock, host, port):
+        sock.start_tls()
+
+    def socket_did_secure(self, sock):
+        sock.send(b'CCC')
+        sock.stop_tls()
+
+    def socket_read_data(self, sock, data):
+        if sock.tls is None:
+            sock.data.extend(data.encode('utf-8'))
+
+
+class Acceptor(object):
+    def __init__(self, test, delegate):
+        self.test = test
+        self.delegate = delegate
+
+    def socket_did_accept_new_socket(self, sock, new_sock):
+        self.test.socket_did_accept_new_socket(sock, new_sock)
+        new_sock.delegate = self.delegate
+
+
+class Closing(object):
+    def __init__(self, events):
+        self.events = events
+
+    def socket_did_connect(self, sock, host, port):
+        sock.start_tls()
+        sock.send(b'bye')
+        sock.close()
+
+    def socket_did_disconnect(self, sock, err=None):
+        self.events.append('disconnect')
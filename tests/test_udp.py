@@ -0,0 +1,38 @@
+import select
+import unittest
+
+from zokket.runloop import EpollRunloop
+from zokket.timers import Timer
+from zokket.udp import UDPSocket
+
+
+@unittest.skipUnless(hasattr(select, 'epoll'), 'epoll is not available')
+class UDPSocketTest(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+
+    def udp_socket_read_data(self, sock, host, port, data):
+        self.received.append(data)
+
+    def test_edge_triggered_reads_every_datagram(self):
+        runloop = EpollRunloop(edge_triggered=True)
+        # Keep the runloop from waiting for events which never arrive.
+        Timer(0.1, lambda timer: None, runloop=runloop)
+
+        server = UDPSocket(self, runloop=runloop)
+        server.bind('127.0.0.1', 0)
+        port = server.socket.getsockname()[1]
+        self.addCleanup(server.close)
+
+        client = UDPSocket(runloop=runloop)
+        self.addCleanup(client.close)
+
+        for data in (b'0', b'1', b'2'):
+            client.send('127.0.0.1', port, data)
+
+        for i in range(5):
+            if len(self.received) == 3:
+                break
+            runloop.run_network()
+
+        self.assertEqual(self.received, [b'0', b'1', b'2'])
@@ -2,6 +2,7 @@ from zokket.tcp import SocketException, TCPSocket
 from zokket.udp import UDPSocket
 from zokket.timers import Timer
 from zokket.runloop import DefaultRunloop, Runloop
+from zokket.group import RunloopGroup
 from zokket.wsgi import WSGIServer
 
 VERSION = (1, 2, 1)
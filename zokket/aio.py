@@ -0,0 +1,157 @@
+import asyncio
+
+from zokket.runloop import BaseRunloop, DefaultRunloop
+
+
+class AsyncioRunloop(BaseRunloop):
+    """
+    Runs zokket sockets and timers on an asyncio event loop, so they can
+    share a single event loop (including uvloop) with asyncio code.
+
+    When no loop is given, the running loop is used or a new event loop is
+    created from the current event loop policy. The runloop never changes
+    the current event loop of the thread.
+    """
+
+    @classmethod
+    def set_default(cls, loop=None):
+        DefaultRunloop.set(lambda: cls(loop))
+
+    def __init__(self, loop=None):
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = asyncio.new_event_loop()
+
+        self.loop = loop
+        self.sockets = {}
+        self.interests = {}
+        self.timers = {}
+        self.drained = None
+
+    @property
+    def running(self):
+        return self.loop.is_running()
+
+    @running.setter
+    def running(self, running):
+        # DefaultRunloop.abort() stops a runloop by clearing running.
+        if not running and self.loop.is_running():
+            self.loop.stop()
+
+    def run(self):
+        try:
+            self.loop.run_forever()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+
+        self.shutdown()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def shutdown(self):
+        [s.close() for s in list(self.sockets.values())]
+
+        # Wait for sockets which are still writing queued data.
+        if self.sockets:
+            self.drained = self.loop.create_future()
+            self.loop.run_until_complete(self.drained)
+            self.drained = None
+
+    # callbacks
+
+    def call_soon(self, callback, *args):
+        self.loop.call_soon(callback, *args)
+
+    def call_soon_threadsafe(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def adopt_socket(self, socket):
+        self.call_soon_threadsafe(super(AsyncioRunloop, self).adopt_socket, socket)
+
+    # timers
+
+    def register_timer(self, timer):
+        self.unregister_timer(timer)
+        self.timers[timer] = self.loop.call_later(max(timer.timeout(), 0),
+                                                  self.fire_timer, timer)
+
+    def unregister_timer(self, timer):
+        handle = self.timers.pop(timer, None)
+        if handle is not None:
+            handle.cancel()
+
+    def fire_timer(self, timer):
+        del self.timers[timer]
+        timer.execute()
+
+        if timer.repeat and timer not in self.timers:
+            self.register_timer(timer)
+
+    # sockets
+
+    def register_socket(self, socket):
+        fd = socket.fileno()
+        if fd < 0:
+            return
+
+        if fd in self.sockets and self.sockets[fd] is not socket:
+            self.unregister_socket(self.sockets[fd])
+
+        self.sockets[fd] = socket
+        self.interests[fd] = (False, False)
+        self.update_socket(socket)
+
+    def update_socket(self, socket):
+        fd = socket.fileno()
+        if self.sockets.get(fd) is not socket:
+            return
+
+        readable, writable = self.interests[fd]
+
+        if socket.readable() != readable:
+            readable = not readable
+            if readable:
+                self.loop.add_reader(fd, self.read_socket, fd)
+            else:
+                self.loop.remove_reader(fd)
+
+        if socket.writable() != writable:
+            writable = not writable
+            if writable:
+                self.loop.add_writer(fd, self.write_socket, fd)
+            else:
+                self.loop.remove_writer(fd)
+
+        self.interests[fd] = (readable, writable)
+
+    def unregister_socket(self, socket):
+        fd = socket.fileno()
+
+        if self.sockets.get(fd) is not socket:
+            fd = next((k for k, v in self.sockets.items() if v is socket), None)
+            if fd is None:
+                return
+
+        readable, writable = self.interests.pop(fd)
+        del self.sockets[fd]
+
+        if readable:
+            self.loop.remove_reader(fd)
+        if writable:
+            self.loop.remove_writer(fd)
+
+        if self.drained is not None and not self.sockets and not self.drained.done():
+            self.drained.set_result(None)
+
+    def read_socket(self, fd):
+        socket = self.sockets.get(fd)
+        if socket is not None:
+            socket.handle_read_event()
+
+    def write_socket(self, fd):
+        socket = self.sockets.get(fd)
+        if socket is not None:
+            socket.handle_write_event()
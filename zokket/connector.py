@@ -0,0 +1,163 @@
+import errno
+import os
+import socket
+
+from zokket.timers import Timer
+
+
+def interleave_addresses(addresses):
+    """
+    Order resolved (family, address) tuples so that the address families
+    alternate, starting with the family of the first address, as described
+    by RFC 8305.
+    """
+
+    if not addresses:
+        return []
+
+    first_family = addresses[0][0]
+    preferred = [a for a in addresses if a[0] == first_family]
+    others = [a for a in addresses if a[0] != first_family]
+
+    ordered = []
+    for index in range(max(len(preferred), len(others))):
+        ordered.extend(group[index] for group in (preferred, others)
+                       if index < len(group))
+    return ordered
+
+
+class ConnectAttempt(object):
+    """
+    A single connection attempt of HappyEyeballs, registered with the
+    runloop until the connection succeeded or failed.
+    """
+
+    def __init__(self, connector, family, address):
+        self.connector = connector
+        self.address = address
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.setblocking(0)
+        connector.sock.apply_socket_options(self.socket)
+
+    def start(self):
+        try:
+            self.socket.connect(self.address)
+        except socket.error as e:
+            if e.errno not in (errno.EINPROGRESS, errno.EALREADY, errno.EWOULDBLOCK):
+                self.socket.close()
+                self.socket = None
+                return e
+
+        self.connector.runloop.register_socket(self)
+
+    def close(self):
+        if self.socket != None:
+            self.connector.runloop.unregister_socket(self)
+            self.socket.close()
+            self.socket = None
+
+    def detach(self):
+        """
+        Stop watching the socket and hand it over.
+        """
+
+        sock = self.socket
+        self.connector.runloop.unregister_socket(self)
+        self.socket = None
+        return sock
+
+    def fileno(self):
+        if self.socket != None:
+            return self.socket.fileno()
+        return -1
+
+    def readable(self):
+        return False
+
+    def writable(self):
+        return self.socket != None
+
+    def handle_read_event(self):
+        pass
+
+    def handle_write_event(self):
+        error = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+
+        if error:
+            self.close()
+            self.connector.attempt_failed(self, socket.error(error, os.strerror(error)))
+        else:
+            self.connector.attempt_connected(self)
+
+    def handle_except_event(self):
+        self.handle_write_event()
+
+
+class HappyEyeballs(object):
+    """
+    Connects a TCPSocket to the first of several addresses which accepts
+    the connection, following RFC 8305. The addresses are tried in turn,
+    each `delay` seconds after the previous attempt was started or as soon
+    as it failed, while earlier attempts are kept going.
+    """
+
+    def __init__(self, sock, addresses, delay=0.25):
+        self.sock = sock
+        self.runloop = sock.runloop
+        self.addresses = interleave_addresses(addresses)
+        self.delay = delay
+        self.attempts = []
+        self.timer = None
+        self.error = None
+
+    def start(self):
+        self.start_next_attempt()
+
+    def start_next_attempt(self, timer=None):
+        if self.timer is not None:
+            self.timer.invalidate()
+            self.timer = None
+
+        while self.addresses:
+            family, address = self.addresses.pop(0)
+            attempt = ConnectAttempt(self, family, address)
+
+            error = attempt.start()
+            if error is not None:
+                self.error = error
+                continue
+
+            self.attempts.append(attempt)
+
+            if self.addresses and self.delay is not None:
+                self.timer = Timer(self.delay, self.start_next_attempt,
+                                   runloop=self.runloop)
+            return
+
+        if not self.attempts:
+            self.sock.connector_did_fail(self.error)
+
+    def attempt_connected(self, attempt):
+        self.attempts.remove(attempt)
+        sock = attempt.detach()
+        self.cancel()
+
+        self.sock.connector_did_connect(sock)
+
+    def attempt_failed(self, attempt, error):
+        self.attempts.remove(attempt)
+        self.error = error
+
+        # Don't wait for the delay when an attempt has already failed.
+        self.start_next_attempt()
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.invalidate()
+            self.timer = None
+
+        for attempt in self.attempts:
+            attempt.close()
+
+        self.attempts = []
+        self.addresses = []
@@ -0,0 +1,110 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from zokket.runloop import DefaultRunloop
+
+
+class RunloopExecutor(object):
+    """
+    Runs blocking or CPU heavy functions away from the runloop, on a thread
+    or process pool, and calls their completion callback back on the
+    runloop with the finished `concurrent.futures.Future`.
+
+    Work submitted for a socket runs one at a time in the order it was
+    submitted, so its callbacks are called in order too. Once a socket has
+    `max_pending` functions waiting, the executor stops reading from the
+    socket until half of them have completed.
+    """
+
+    THREAD = 'thread'
+    PROCESS = 'process'
+
+    def __init__(self, backend=THREAD, max_workers=None, max_pending=16,
+            runloop=None):
+        if backend == self.THREAD:
+            self.pool = ThreadPoolExecutor(max_workers)
+        elif backend == self.PROCESS:
+            self.pool = ProcessPoolExecutor(max_workers)
+        else:
+            raise ValueError('Unknown backend {}'.format(backend))
+
+        self.max_pending = max_pending
+        self.queues = {}
+        self.runloop = runloop
+
+    @property
+    def runloop(self):
+        if not self._runloop:
+            self._runloop = DefaultRunloop.default()
+
+        return self._runloop
+
+    @runloop.setter
+    def runloop(self, runloop):
+        self._runloop = runloop
+
+    def submit(self, func, args=(), callback=None, sock=None):
+        """
+        Call func with args on the pool. The callback, if given, is called
+        on the runloop with the future once the function has completed.
+
+        When a socket is given, the function is queued behind any other
+        work submitted for the same socket.
+        """
+
+        if sock is None:
+            self.start(func, args, callback, None)
+            return
+
+        key = id(sock)
+        queue = self.queues.get(key)
+
+        if queue is None:
+            self.queues[key] = deque()
+            self.start(func, args, callback, sock)
+            return
+
+        queue.append((func, args, callback))
+
+        if len(queue) + 1 >= self.max_pending:
+            sock.hold_reading(self)
+
+    def start(self, func, args, callback, sock):
+        future = self.pool.submit(func, *args)
+        future.add_done_callback(lambda f: self.runloop.call_soon_threadsafe(
+            self.completed, f, callback, sock))
+
+    def completed(self, future, callback, sock):
+        if sock is not None:
+            self.start_next(sock)
+
+        if callback:
+            callback(future)
+
+    def start_next(self, sock):
+        key = id(sock)
+        queue = self.queues[key]
+
+        if not queue:
+            del self.queues[key]
+            sock.release_reading(self)
+            return
+
+        func, args, callback = queue.popleft()
+        self.start(func, args, callback, sock)
+
+        if len(queue) + 1 <= self.max_pending // 2:
+            sock.release_reading(self)
+
+    def pending(self, sock):
+        """
+        The amount of functions waiting or running for the socket.
+        """
+
+        queue = self.queues.get(id(sock))
+        if queue is None:
+            return 0
+        return len(queue) + 1
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait)
@@ -0,0 +1,268 @@
+__all__ = ['FramingError', 'Codec', 'LengthPrefixCodec', 'VarintCodec',
+           'NetstringCodec', 'DelimiterCodec', 'FunctionCodec']
+
+import struct
+
+
+class FramingError(Exception):
+    pass
+
+
+class Codec(object):
+    """
+    Splits the data received by a TCPSocket into frames. A codec is
+    assigned to `TCPSocket.codec` and may keep state between reads, so
+    every socket needs its own instance.
+    """
+
+    def decode(self, buffer, start, end):
+        """
+        Parse as many complete frames as possible out of buffer[start:end].
+
+        Returns a list with the start and end offset of the payload of each
+        frame, and the offset of the first byte which was not consumed.
+        """
+        raise NotImplementedError
+
+    def encode(self, data):
+        """
+        Returns a list of buffers which make up a frame containing data.
+        """
+        return [data]
+
+
+class LengthPrefixCodec(Codec):
+    """
+    Frames which start with their payload length as an unsigned integer
+    of `width` bytes (1, 2, 4 or 8) in either 'big' or 'little' byteorder.
+    """
+
+    formats = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+    def __init__(self, width=4, byteorder='big', max_length=None):
+        if width not in self.formats:
+            raise ValueError('Unsupported length prefix width {}'.format(width))
+
+        if byteorder not in ('big', 'little'):
+            raise ValueError('byteorder must be either \'big\' or \'little\'')
+
+        order = '>' if byteorder == 'big' else '<'
+        self.header = struct.Struct(order + self.formats[width])
+        self.max_length = max_length
+
+    def check_length(self, length):
+        if self.max_length is not None and length > self.max_length:
+            raise FramingError('Frame of {} bytes exceeds the maximum of {}'.format(
+                length, self.max_length))
+
+    def read_length(self, buffer, offset, end):
+        """
+        Returns the payload length and the offset the payload starts at, or
+        None when the prefix hasn't been received completely.
+        """
+
+        if end - offset < self.header.size:
+            return None
+
+        length, = self.header.unpack_from(buffer, offset)
+        return length, offset + self.header.size
+
+    def write_length(self, length):
+        return self.header.pack(length)
+
+    def decode(self, buffer, start, end):
+        frames = []
+
+        while start < end:
+            prefix = self.read_length(buffer, start, end)
+            if prefix is None:
+                break
+
+            length, payload_start = prefix
+            self.check_length(length)
+
+            payload_end = payload_start + length
+            if payload_end > end:
+                break
+
+            frames.append((payload_start, payload_end))
+            start = payload_end
+
+        return frames, start
+
+    def encode(self, data):
+        length = memoryview(data).nbytes
+        self.check_length(length)
+        return [self.write_length(length), data]
+
+
+class VarintCodec(LengthPrefixCodec):
+    """
+    Frames which start with their payload length as an unsigned varint,
+    seven bits per byte with the least significant group first as used by
+    protocol buffers.
+    """
+
+    max_prefix_size = 10
+
+    def __init__(self, max_length=None):
+        self.max_length = max_length
+
+    def read_length(self, buffer, offset, end):
+        length = 0
+        shift = 0
+
+        for index in range(offset, min(end, offset + self.max_prefix_size)):
+            byte = buffer[index]
+            length |= (byte & 0x7f) << shift
+
+            if not byte & 0x80:
+                return length, index + 1
+
+            shift += 7
+
+        if end - offset >= self.max_prefix_size:
+            raise FramingError('Varint length prefix is too long')
+
+        return None
+
+    def write_length(self, length):
+        prefix = bytearray()
+
+        while length > 0x7f:
+            prefix.append((length & 0x7f) | 0x80)
+            length >>= 7
+
+        prefix.append(length)
+        return bytes(prefix)
+
+
+class NetstringCodec(Codec):
+    """
+    Netstrings, frames in the form `<length>:<payload>,` where length is
+    written in decimal.
+    """
+
+    def __init__(self, max_length=None):
+        self.max_length = max_length
+
+    def decode(self, buffer, start, end):
+        frames = []
+
+        while start < end:
+            colon = buffer.find(b':', start, min(end, start + 21))
+
+            if colon == -1:
+                if end - start > 20:
+                    raise FramingError('Netstring length is too long')
+                break
+
+            digits = bytes(buffer[start:colon])
+            if not digits.isdigit():
+                raise FramingError('Invalid netstring length {!r}'.format(digits))
+
+            length = int(digits)
+            if self.max_length is not None and length > self.max_length:
+                raise FramingError('Frame of {} bytes exceeds the maximum of {}'.format(
+                    length, self.max_length))
+
+            payload_end = colon + 1 + length
+            if payload_end >= end:
+                break
+
+            if buffer[payload_end] != ord(','):
+                raise FramingError('Netstring is missing the trailing comma')
+
+            frames.append((colon + 1, payload_end))
+            start = payload_end + 1
+
+        return frames, start
+
+    def encode(self, data):
+        length = memoryview(data).nbytes
+        return [str(length).encode('ascii') + b':', data, b',']
+
+
+class DelimiterCodec(Codec):
+    """
+    Frames which are terminated by a delimiter. The delimiter is removed
+    from the payload unless `include_delimiter` is set.
+    """
+
+    def __init__(self, delimiter=b'\r\n', include_delimiter=False,
+                 max_length=None):
+        self.delimiter = delimiter
+        self.include_delimiter = include_delimiter
+        self.max_length = max_length
+
+        # Amount of bytes after the start of the pending frame which are
+        # known not to contain the delimiter.
+        self.searched = 0
+
+    def decode(self, buffer, start, end):
+        frames = []
+        delimiter = self.delimiter
+        size = len(delimiter)
+
+        while start < end:
+            index = buffer.find(delimiter, start + self.searched, end)
+
+            if index == -1:
+                self.searched = max(end - start - size + 1, 0)
+
+                if self.max_length is not None and self.searched > self.max_length:
+                    raise FramingError('Frame exceeds the maximum of {} bytes'.format(
+                        self.max_length))
+                break
+
+            self.searched = 0
+
+            if self.include_delimiter:
+                frames.append((start, index + size))
+            else:
+                frames.append((start, index))
+
+            start = index + size
+
+        return frames, start
+
+    def encode(self, data):
+        return [data, self.delimiter]
+
+
+class FunctionCodec(Codec):
+    """
+    Frames determined by a function, which is called with a memoryview of
+    the unconsumed data and returns the length of the first complete frame
+    or None when no frame is complete yet. The optional encoder converts
+    outgoing data into a frame.
+    """
+
+    def __init__(self, function, encoder=None):
+        self.function = function
+        self.encoder = encoder
+
+    def decode(self, buffer, start, end):
+        frames = []
+
+        with memoryview(buffer) as view:
+            while start < end:
+                with view[start:end] as pending:
+                    length = self.function(pending)
+
+                if not length:
+                    break
+
+                if length > end - start:
+                    raise FramingError('Frame length {} exceeds the received data'.format(
+                        length))
+
+                frames.append((start, start + length))
+                start += length
+
+        return frames, start
+
+    def encode(self, data):
+        if self.encoder is None:
+            return [data]
+        return [self.encoder(data)]
@@ -0,0 +1,64 @@
+import threading
+from os import cpu_count
+
+from zokket.runloop import SelectRunloop
+
+
+class RunloopGroup(object):
+    """
+    A group of runloops which each run on their own thread.
+
+    Returning the group from the `socket_wants_runloop_for_new_socket`
+    delegate method spreads accepted sockets across its runloops, either
+    round-robin or to the runloop with the least sockets. Work which
+    releases the GIL, such as TLS and zlib, can then make use of more than
+    one core.
+    """
+
+    ROUND_ROBIN = 'round-robin'
+    LEAST_CONNECTIONS = 'least-connections'
+
+    def __init__(self, size=None, runloop_class=SelectRunloop,
+            strategy=ROUND_ROBIN):
+        if strategy not in (self.ROUND_ROBIN, self.LEAST_CONNECTIONS):
+            raise ValueError('Unknown strategy {}'.format(strategy))
+
+        self.strategy = strategy
+        self.runloops = [runloop_class() for i in range(size or cpu_count() or 1)]
+        self.threads = []
+        self.next_index = 0
+
+    def __len__(self):
+        return len(self.runloops)
+
+    def start(self):
+        for runloop in self.runloops:
+            thread = threading.Thread(target=runloop.run)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        for runloop in self.runloops:
+            runloop.stop()
+
+    def join(self, timeout=None):
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def next_runloop(self):
+        if self.strategy == self.LEAST_CONNECTIONS:
+            return min(self.runloops,
+                       key=lambda r: len(r.sockets) + len(r.callbacks))
+
+        runloop = self.runloops[self.next_index]
+        self.next_index = (self.next_index + 1) % len(self.runloops)
+        return runloop
+
+    def adopt_socket(self, sock):
+        """
+        Hand a newly accepted socket to one of the runloops in the group.
+        This is safe to call from any thread.
+        """
+
+        self.next_runloop().adopt_socket(sock)
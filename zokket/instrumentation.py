@@ -0,0 +1,134 @@
+import bisect
+import logging
+
+from time import perf_counter
+
+logger = logging.getLogger('zokket.runloop')
+
+
+class Histogram(object):
+    """
+    Counts recorded values into fixed buckets, each bucket counts the values
+    up to and including its upper bound.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+        if value > self.max:
+            self.max = value
+
+    def mean(self):
+        if self.count:
+            return self.total / float(self.count)
+        return 0
+
+    def percentile(self, percent):
+        """
+        The upper bound of the bucket which holds the given percentile, or
+        the largest recorded value for the overflow bucket.
+        """
+
+        target = self.count * percent / 100.0
+        seen = 0
+
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target and count:
+                return bound
+
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.mean(),
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'buckets': list(zip(self.bounds + (None,), self.counts)),
+        }
+
+
+DURATION_BOUNDS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+COUNT_BOUNDS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class RunloopInstrumentation(object):
+    """
+    Counters and histograms describing how a runloop spends its time.
+
+    Records the time spent waiting for network events, the time spent
+    processing each iteration, how many sockets were ready per wake up, the
+    time spent in each handler per delegate class and how late timers fire.
+    Handlers which take longer than `slow_callback_threshold` seconds are
+    logged.
+    """
+
+    def __init__(self, slow_callback_threshold=0.1):
+        self.slow_callback_threshold = slow_callback_threshold
+
+        self.iterations = 0
+        self.slow_callbacks = 0
+        self.last_poll_wait = 0
+        self.poll_wait = Histogram(DURATION_BOUNDS)
+        self.iteration_time = Histogram(DURATION_BOUNDS)
+        self.ready_sockets = Histogram(COUNT_BOUNDS)
+        self.timer_lateness = Histogram(DURATION_BOUNDS)
+        self.handlers = {}
+
+    def record_poll(self, elapsed, events):
+        self.last_poll_wait = elapsed
+        self.poll_wait.record(elapsed)
+
+        if isinstance(events, tuple):
+            # select() returns a list of sockets for each kind of event.
+            ready = len(set(id(s) for sockets in events for s in sockets))
+        else:
+            ready = len(events)
+
+        self.ready_sockets.record(ready)
+
+    def call(self, owner, handler, *args):
+        start = perf_counter()
+
+        try:
+            return handler(*args)
+        finally:
+            self.record_handler(owner, handler, perf_counter() - start)
+
+    def record_handler(self, owner, handler, elapsed):
+        delegate = getattr(owner, 'delegate', None) or owner
+        key = (delegate.__class__.__name__, getattr(handler, '__name__', repr(handler)))
+
+        histogram = self.handlers.get(key)
+        if histogram is None:
+            histogram = self.handlers[key] = Histogram(DURATION_BOUNDS)
+
+        histogram.record(elapsed)
+
+        if elapsed >= self.slow_callback_threshold:
+            self.slow_callbacks += 1
+            logger.warning('Slow callback %s.%s for %r took %.3f seconds',
+                           key[0], key[1], owner, elapsed)
+
+    def snapshot(self):
+        return {
+            'iterations': self.iterations,
+            'slow_callbacks': self.slow_callbacks,
+            'poll_wait': self.poll_wait.snapshot(),
+            'iteration_time': self.iteration_time.snapshot(),
+            'ready_sockets': self.ready_sockets.snapshot(),
+            'timer_lateness': self.timer_lateness.snapshot(),
+            'handlers': dict(('{}.{}'.format(*key), histogram.snapshot())
+                             for key, histogram in self.handlers.items()),
+        }
@@ -0,0 +1,151 @@
+__all__ = ['SocketOptions', 'register_profile', 'get_profile']
+
+import errno
+import socket
+import sys
+
+# The socket module doesn't define TCP_FASTOPEN_CONNECT, Linux 4.11 added
+# it as option 30.
+TCP_FASTOPEN_CONNECT = getattr(socket, 'TCP_FASTOPEN_CONNECT',
+                               30 if sys.platform.startswith('linux') else None)
+
+
+class SocketOptions(object):
+    """
+    A reusable set of options for TCP sockets, applied before a socket
+    connects or starts listening. Options which aren't supported by the
+    platform are skipped.
+
+    `fastopen` and `defer_accept` are options for listening sockets,
+    `fastopen` is the length of the queue of pending Fast Open requests
+    and `defer_accept` the amount of seconds to wait for data before a
+    connection is accepted. Connecting sockets with `fastopen` set use
+    TCP_FASTOPEN_CONNECT on Linux, accepted sockets leave it out.
+
+    Additional options can be given as (level, option, value) tuples.
+    """
+
+    fields = ('nodelay', 'keepalive', 'keepalive_idle', 'keepalive_interval',
+              'keepalive_count', 'send_buffer', 'receive_buffer', 'quickack',
+              'fastopen', 'defer_accept', 'options')
+
+    def __init__(self, nodelay=None, keepalive=None, keepalive_idle=None,
+            keepalive_interval=None, keepalive_count=None, send_buffer=None,
+            receive_buffer=None, quickack=None, fastopen=None,
+            defer_accept=None, options=()):
+        self.nodelay = nodelay
+        self.keepalive = keepalive
+        self.keepalive_idle = keepalive_idle
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        self.send_buffer = send_buffer
+        self.receive_buffer = receive_buffer
+        self.quickack = quickack
+        self.fastopen = fastopen
+        self.defer_accept = defer_accept
+        self.options = tuple(options)
+
+    def __repr__(self):
+        options = ('{}={!r}'.format(field, getattr(self, field))
+                   for field in self.fields if getattr(self, field) not in (None, ()))
+        return '<SocketOptions {}>'.format(' '.join(options))
+
+    def copy(self, **overrides):
+        """
+        A copy of these options with some of them changed.
+        """
+
+        values = dict((field, getattr(self, field)) for field in self.fields)
+        values.update(overrides)
+        return self.__class__(**values)
+
+    def socket_options(self, listening=False, accepted=False):
+        """
+        The (level, option, value) tuples to set on a socket. Options for
+        connecting are left out for a listening socket, or for a socket
+        which was accepted and is already connected.
+        """
+
+        tcp = socket.IPPROTO_TCP
+        options = []
+
+        def add(level, name, value):
+            if value is not None and hasattr(socket, name):
+                options.append((level, getattr(socket, name), int(value)))
+
+        add(tcp, 'TCP_NODELAY', self.nodelay)
+        add(socket.SOL_SOCKET, 'SO_SNDBUF', self.send_buffer)
+        add(socket.SOL_SOCKET, 'SO_RCVBUF', self.receive_buffer)
+        add(socket.SOL_SOCKET, 'SO_KEEPALIVE', self.keepalive)
+
+        if self.keepalive:
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                add(tcp, 'TCP_KEEPIDLE', self.keepalive_idle)
+            else:
+                # macOS names the idle time TCP_KEEPALIVE.
+                add(tcp, 'TCP_KEEPALIVE', self.keepalive_idle)
+
+            add(tcp, 'TCP_KEEPINTVL', self.keepalive_interval)
+            add(tcp, 'TCP_KEEPCNT', self.keepalive_count)
+
+        if listening:
+            add(tcp, 'TCP_FASTOPEN', self.fastopen)
+            add(tcp, 'TCP_DEFER_ACCEPT', self.defer_accept)
+        else:
+            add(tcp, 'TCP_QUICKACK', self.quickack)
+
+            if self.fastopen and not accepted and TCP_FASTOPEN_CONNECT is not None:
+                options.append((tcp, TCP_FASTOPEN_CONNECT, 1))
+
+        for level, name, value in self.options:
+            options.append((level, name, value))
+
+        return options
+
+    def apply(self, sock, listening=False, accepted=False):
+        """
+        Set the options on a socket.socket. Options the kernel doesn't
+        support are ignored.
+        """
+
+        for level, name, value in self.socket_options(listening, accepted):
+            try:
+                sock.setsockopt(level, name, value)
+            except socket.error as e:
+                if e.errno not in (errno.ENOPROTOOPT, errno.EOPNOTSUPP):
+                    raise
+
+
+profiles = {}
+
+
+def register_profile(name, options):
+    """
+    Register SocketOptions under a name, so sockets can refer to them by
+    name in `TCPSocket.socket_options`.
+    """
+
+    profiles[name] = options
+
+
+def get_profile(options):
+    """
+    Returns the SocketOptions for a registered profile name, or options
+    when they aren't a name.
+    """
+
+    if isinstance(options, str):
+        try:
+            return profiles[options]
+        except KeyError:
+            raise ValueError('Unknown socket option profile {!r}'.format(options))
+
+    return options
+
+
+register_profile('low-latency', SocketOptions(nodelay=True, quickack=True))
+register_profile('keepalive', SocketOptions(keepalive=True, keepalive_idle=60,
+                                            keepalive_interval=10, keepalive_count=6))
+register_profile('bulk', SocketOptions(send_buffer=4 * 1024 * 1024,
+                                       receive_buffer=4 * 1024 * 1024))
+register_profile('server', SocketOptions(nodelay=True, fastopen=256, defer_accept=5))
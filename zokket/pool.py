@@ -0,0 +1,388 @@
+import errno
+import socket
+from collections import deque
+
+from zokket.runloop import DefaultRunloop, monotonic
+from zokket.tcp import SocketException, TCPSocket
+from zokket.timers import Timer
+
+
+class PoolTimeout(SocketException):
+    pass
+
+
+class PoolClosed(SocketException):
+    pass
+
+
+def pool_key(host, port, tls):
+    if tls and not isinstance(tls, dict):
+        tls = {}
+
+    if tls is None or tls is False:
+        return (host, port, None)
+
+    return (host, port, tuple(sorted(tls.items())))
+
+
+class PoolConnection(object):
+    """
+    The delegate of a pooled socket while it is connecting or idle.
+    """
+
+    def __init__(self, pool, key, tls):
+        self.pool = pool
+        self.key = key
+        self.tls = tls
+        self.ready = False
+        self.idle_since = None
+        self.sock = TCPSocket(self, runloop=pool.runloop)
+
+    def socket_did_connect(self, sock, host, port):
+        if self.tls is None:
+            self.pool.connection_ready(self)
+        elif not sock.start_tls(**self.tls):
+            sock.close(SocketException('TLS is not available'))
+
+    def socket_did_secure(self, sock):
+        self.pool.connection_ready(self)
+
+    def socket_connection_timeout(self, sock, host, port):
+        self.pool.connection_failed(self, PoolTimeout(
+            'Timed out connecting to {}:{}'.format(host, port)))
+
+    def socket_read_data(self, sock, data):
+        # An idle connection must not receive anything, the state of the
+        # protocol is unknown so it can't be reused.
+        sock.close()
+
+    def socket_did_disconnect(self, sock, err=None):
+        if self.ready:
+            self.pool.connection_closed(self)
+        else:
+            self.pool.connection_failed(self, err or SocketException(
+                'Connection to {}:{} was closed'.format(*self.key[:2])))
+
+
+class Waiter(object):
+    def __init__(self, key, tls, callback, delegate):
+        self.key = key
+        self.tls = tls
+        self.callback = callback
+        self.delegate = delegate
+        self.timer = None
+
+
+class ConnectionPool(object):
+    """
+    Keeps connected TCPSockets around to be reused, instead of paying for
+    a new TCP and TLS handshake for every request to the same backend.
+
+    Connections are pooled per host, port and TLS settings, with at most
+    `max_size` connections for each. Idle connections are closed after
+    `idle_timeout` seconds and are checked every `health_check_interval`
+    seconds, as well as before they are handed out.
+
+    Every acquired socket must be given back with `release`, also when it
+    has been closed.
+    """
+
+    def __init__(self, max_size=10, idle_timeout=60, connect_timeout=None,
+            health_check_interval=10, health_check=None, runloop=None):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.health_check = health_check
+        self.runloop = runloop
+
+        self.idle = {}
+        self.leased = {}
+        self.sizes = {}
+        self.waiters = {}
+        self.closed = False
+
+        self.health_check_timer = None
+        if health_check_interval:
+            self.health_check_timer = Timer(health_check_interval,
+                self.check_idle_connections, True, runloop=self.runloop)
+
+    @property
+    def runloop(self):
+        if not self._runloop:
+            self._runloop = DefaultRunloop.default()
+
+        return self._runloop
+
+    @runloop.setter
+    def runloop(self, runloop):
+        self._runloop = runloop
+
+    def size(self, host, port, tls=None):
+        """
+        The amount of open and connecting connections to a backend.
+        """
+        return self.sizes.get(pool_key(host, port, tls), 0)
+
+    def idle_count(self, host, port, tls=None):
+        return len(self.idle.get(pool_key(host, port, tls), ()))
+
+    def acquire(self, host, port, callback, delegate=None, timeout=None,
+            tls=None):
+        """
+        Get a connected socket for host and port. The callback is called
+        with the socket and None, or with None and an exception when no
+        connection could be made or none became free within timeout.
+
+        The socket is handed out with delegate as its delegate. When tls is
+        True or a dict of `start_tls` arguments, the connection is secured
+        before it is handed out.
+        """
+
+        if self.closed:
+            raise PoolClosed('The connection pool is closed')
+
+        key = pool_key(host, port, tls)
+        if tls is not None and tls is not False:
+            tls = dict(key[2])
+        else:
+            tls = None
+
+        waiter = Waiter(key, tls, callback, delegate)
+
+        connection = self.pop_idle(key)
+        if connection is not None:
+            self.lease(connection, waiter)
+            return
+
+        waiters = self.waiters.setdefault(key, deque())
+        waiters.append(waiter)
+
+        if timeout is not None:
+            waiter.timer = Timer(timeout, self.waiter_timeout, False, waiter,
+                                 runloop=self.runloop)
+
+        if self.sizes.get(key, 0) < self.max_size:
+            self.open_connection(key, tls)
+
+    def release(self, sock):
+        """
+        Give back a socket acquired from the pool. Connections which were
+        closed or still have unread or unsent data aren't reused.
+        """
+
+        connection = self.leased.pop(id(sock), None)
+        if connection is None:
+            return
+
+        reusable = not self.closed and sock.socket != None and \
+            sock.connected and not sock.closing and not sock.read_buffer and \
+            not sock.write_queue and sock.relay is None
+
+        if not reusable:
+            self.discard(connection)
+            return
+
+        sock.delegate = connection
+        sock.read_until_data = sock.read_until_length = sock.codec = None
+
+        waiter = self.next_waiter(connection.key)
+        if waiter is not None:
+            self.lease(connection, waiter)
+        else:
+            self.add_idle(connection)
+
+    def close(self):
+        """
+        Close the idle connections and fail the waiting requests. Leased
+        connections are closed once they are released.
+        """
+
+        self.closed = True
+
+        if self.health_check_timer is not None:
+            self.health_check_timer.invalidate()
+            self.health_check_timer = None
+
+        for key in list(self.waiters):
+            while True:
+                waiter = self.next_waiter(key)
+                if waiter is None:
+                    break
+                waiter.callback(None, PoolClosed('The connection pool is closed'))
+
+        for connections in list(self.idle.values()):
+            for connection in list(connections):
+                connection.sock.close()
+
+    # Connections
+
+    def open_connection(self, key, tls):
+        self.sizes[key] = self.sizes.get(key, 0) + 1
+
+        connection = PoolConnection(self, key, tls)
+        connection.sock.connect(key[0], key[1], self.connect_timeout)
+
+    def connection_ready(self, connection):
+        connection.ready = True
+
+        waiter = self.next_waiter(connection.key)
+        if waiter is not None:
+            self.lease(connection, waiter)
+        else:
+            self.add_idle(connection)
+
+    def connection_failed(self, connection, err):
+        self.remove_connection(connection)
+
+        # The request which caused this connection to be opened is failed,
+        # the others keep waiting for a connection to be released.
+        waiters = self.waiters.get(connection.key)
+        pending = self.sizes.get(connection.key, 0) - \
+            self.leased_count(connection.key) - len(self.idle.get(connection.key, ()))
+
+        if waiters and len(waiters) > pending:
+            waiter = self.next_waiter(connection.key)
+            waiter.callback(None, err)
+
+    def connection_closed(self, connection):
+        self.remove_connection(connection)
+
+        waiters = self.waiters.get(connection.key)
+        if waiters and not self.closed:
+            self.open_connection(connection.key, waiters[0].tls)
+
+    def remove_connection(self, connection):
+        key = connection.key
+        self.remove_idle(connection)
+
+        self.sizes[key] -= 1
+        if not self.sizes[key]:
+            del self.sizes[key]
+
+    def discard(self, connection):
+        sock = connection.sock
+        sock.delegate = connection
+
+        if sock.socket != None:
+            sock.close()
+        else:
+            self.connection_closed(connection)
+
+    def leased_count(self, key):
+        return sum(1 for connection in self.leased.values() if connection.key == key)
+
+    def lease(self, connection, waiter):
+        if waiter.timer is not None:
+            waiter.timer.invalidate()
+
+        sock = connection.sock
+        sock.delegate = waiter.delegate
+        connection.idle_since = None
+        self.leased[id(sock)] = connection
+
+        waiter.callback(sock, None)
+
+    # Idle connections
+
+    def add_idle(self, connection):
+        if self.closed:
+            return connection.sock.close()
+
+        connection.idle_since = monotonic()
+        self.idle.setdefault(connection.key, deque()).append(connection)
+
+    def pop_idle(self, key):
+        """
+        The most recently used healthy idle connection, so the least used
+        ones are left to time out.
+        """
+
+        while key in self.idle:
+            connection = self.idle[key][-1]
+            self.remove_idle(connection)
+
+            if self.is_healthy(connection.sock):
+                return connection
+
+            connection.sock.close()
+
+        return None
+
+    def remove_idle(self, connection):
+        idle = self.idle.get(connection.key)
+
+        if idle is not None and connection in idle:
+            idle.remove(connection)
+            if not idle:
+                del self.idle[connection.key]
+
+    def is_healthy(self, sock):
+        """
+        Whether an idle socket is still connected without any unexpected
+        data waiting, and passes the `health_check` function if one was
+        given.
+        """
+
+        if sock.socket == None or not sock.connected or sock.closing:
+            return False
+
+        if sock.read_buffer:
+            return False
+
+        try:
+            sock.socket.recv(1, socket.MSG_PEEK)
+            # Either unexpected data or a TLS alert is waiting, or the peer
+            # closed the connection.
+            return False
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return False
+
+        return self.health_check is None or self.health_check(sock)
+
+    def check_idle_connections(self, timer=None):
+        """
+        Close idle connections which timed out or fail their health check.
+        """
+
+        now = monotonic()
+
+        for idle in list(self.idle.values()):
+            for connection in list(idle):
+                expired = self.idle_timeout is not None and \
+                    now - connection.idle_since >= self.idle_timeout
+
+                if expired or not self.is_healthy(connection.sock):
+                    connection.sock.close()
+
+    # Waiters
+
+    def next_waiter(self, key):
+        waiters = self.waiters.get(key)
+        if not waiters:
+            return None
+
+        waiter = waiters.popleft()
+        if not waiters:
+            del self.waiters[key]
+
+        if waiter.timer is not None:
+            waiter.timer.invalidate()
+            waiter.timer = None
+
+        return waiter
+
+    def waiter_timeout(self, timer):
+        waiter = timer.data
+        waiters = self.waiters.get(waiter.key)
+
+        if waiters is None or waiter not in waiters:
+            return
+
+        waiters.remove(waiter)
+        if not waiters:
+            del self.waiters[waiter.key]
+
+        waiter.timer = None
+        waiter.callback(None, PoolTimeout(
+            'Timed out waiting for a connection to {}:{}'.format(*waiter.key[:2])))
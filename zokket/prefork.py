@@ -0,0 +1,161 @@
+import errno
+import os
+import signal
+import sys
+import time
+import traceback
+from os import cpu_count
+
+from zokket.runloop import DefaultRunloop, SelectRunloop, monotonic
+
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class PreforkServer(object):
+    """
+    Forks a number of worker processes which each run their own runloop.
+
+    The setup callable is called in every worker once it has been forked and
+    should create the workers listening sockets, binding them with
+    `reuse_port` so the kernel balances connections across the workers::
+
+        PreforkServer(lambda: WSGIServer(app, port=8080, reuse_port=True)).run()
+
+    Workers which exit while the server is running are restarted. Sending
+    SIGTERM or SIGINT to the supervisor stops the workers gracefully, each
+    worker closes its sockets and finishes writing queued data before it
+    exits.
+    """
+
+    def __init__(self, setup, workers=None, runloop_class=SelectRunloop,
+            graceful_timeout=30, restart_delay=1, poll_interval=0.1):
+        self.setup = setup
+        self.worker_count = workers or cpu_count() or 1
+        self.runloop_class = runloop_class
+        self.graceful_timeout = graceful_timeout
+        self.restart_delay = restart_delay
+        self.poll_interval = poll_interval
+
+        self.workers = {}
+        self.running = False
+        self.stop_deadline = None
+
+    def run(self):
+        """
+        Start the workers and supervise them until the server is stopped.
+        """
+
+        self.running = True
+
+        signal.signal(signal.SIGTERM, self.handle_stop_signal)
+        signal.signal(signal.SIGINT, self.handle_stop_signal)
+
+        for i in range(self.worker_count):
+            self.spawn_worker()
+
+        while self.workers:
+            # Never block in waitpid, a blocking call is retried after the
+            # stop signal has been handled (PEP 475) which would keep the
+            # graceful timeout from being enforced.
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.ECHILD:
+                    break
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            if pid == 0:
+                self.check_stop_deadline()
+                time.sleep(self.poll_interval)
+                continue
+
+            started = self.workers.pop(pid, None)
+            if started is None or not self.running:
+                continue
+
+            # Don't fork in a tight loop when workers crash on startup.
+            if monotonic() - started < self.restart_delay:
+                time.sleep(self.restart_delay)
+
+            if self.running:
+                self.spawn_worker()
+
+    def stop(self):
+        """
+        Ask every worker to shut down gracefully.
+        """
+
+        self.running = False
+        self.stop_deadline = monotonic() + self.graceful_timeout
+        self.signal_workers(signal.SIGTERM)
+
+    def handle_stop_signal(self, signum, frame):
+        if self.running:
+            self.stop()
+
+    def check_stop_deadline(self):
+        if self.stop_deadline is not None and monotonic() > self.stop_deadline:
+            self.signal_workers(signal.SIGKILL)
+            self.stop_deadline = None
+
+    def signal_workers(self, signum):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def spawn_worker(self):
+        # Hold the stop signals until the supervisor knows the workers pid,
+        # and the worker has installed its own handlers.
+        signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+
+        try:
+            pid = os.fork()
+        except OSError:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+            raise
+
+        if pid:
+            self.workers[pid] = monotonic()
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+            return pid
+
+        status = 1
+        try:
+            self.run_worker()
+            status = 0
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                status = e.code or 0
+        except BaseException:
+            # os._exit() skips the interpreter printing the traceback.
+            traceback.print_exc()
+        finally:
+            sys.stderr.flush()
+            os._exit(status)
+
+    def run_worker(self):
+        self.workers = {}
+
+        signal.signal(signal.SIGTERM, self.handle_worker_signal)
+        signal.signal(signal.SIGINT, self.handle_worker_signal)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+
+        # Never share the supervisors runloop (or its epoll instance).
+        DefaultRunloop.set(self.runloop_class)
+
+        self.setup()
+        DefaultRunloop.run()
+
+    def handle_worker_signal(self, signum, frame):
+        # Let the worker finish shutting down, the supervisor will kill it
+        # if it takes longer than the graceful timeout.
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        # Runloop.run() treats SystemExit as a request to shut down.
+        raise SystemExit
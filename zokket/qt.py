@@ -1,4 +1,6 @@
-from PyQt4.QtCore import QObject, QSocketNotifier, SIGNAL, QBasicTimer
+from collections import deque
+
+from PyQt4.QtCore import QObject, QSocketNotifier, SIGNAL, QBasicTimer, Qt
 from zokket.runloop import DefaultRunloop
 
 
@@ -14,6 +16,12 @@ class QtRunloop(QObject):
         super(QtRunloop, self).__init__()
         self.sockets = []
         self.timers = []
+        self.callbacks = deque()
+
+        # A queued connection posts an event to the thread running the Qt
+        # event loop, even when the signal is emitted from another thread.
+        self.connect(self, SIGNAL('callbacksQueued()'), self.run_callbacks,
+                     Qt.QueuedConnection)
 
     def set_application(self, app):
         self.connect(app, SIGNAL('aboutToQuit()'), self.shutdown)
@@ -41,6 +49,30 @@ class QtRunloop(QObject):
             if timer.qtimer.timerId() == event.timerId():
                 return timer.execute()
 
+    # callbacks
+
+    def call_soon(self, callback, *args):
+        """
+        Call the callback with args once control returns to the Qt event
+        loop.
+        """
+
+        self.callbacks.append((callback, args))
+        self.emit(SIGNAL('callbacksQueued()'))
+
+    def call_soon_threadsafe(self, callback, *args):
+        """
+        Call the callback with args on the thread running the Qt event
+        loop. This may be called from any thread.
+        """
+
+        self.call_soon(callback, *args)
+
+    def run_callbacks(self):
+        for i in range(len(self.callbacks)):
+            callback, args = self.callbacks.popleft()
+            callback(*args)
+
     # sockets
 
     def register_socket(self, socket):
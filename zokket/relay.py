@@ -0,0 +1,218 @@
+import errno
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SPLICE_FLAGS = getattr(os, 'SPLICE_F_MOVE', 0) | getattr(os, 'SPLICE_F_NONBLOCK', 0)
+
+
+def is_plain_socket(sock):
+    return sock.tls is None
+
+
+class RelayDirection(object):
+    """
+    Moves data from one socket to another.
+
+    With `os.splice` the data is moved through a pipe inside the kernel,
+    otherwise it is received into Python and queued with `send`. Either way
+    the source stops being read while the destination can't keep up.
+    """
+
+    def __init__(self, source, destination, pipe_size):
+        self.source = source
+        self.destination = destination
+        self.pipe_size = pipe_size
+        self.pending = 0
+        self.eof = False
+        self.finished = False
+
+        self.use_splice = hasattr(os, 'splice') and \
+            is_plain_socket(source) and is_plain_socket(destination)
+
+        if self.use_splice:
+            self.read_fd, self.write_fd = os.pipe()
+            for fd in (self.read_fd, self.write_fd):
+                os.set_blocking(fd, False)
+
+            if fcntl is not None and hasattr(fcntl, 'F_SETPIPE_SZ'):
+                try:
+                    fcntl.fcntl(self.write_fd, fcntl.F_SETPIPE_SZ, pipe_size)
+                except (IOError, OSError):
+                    pass
+
+    def close(self):
+        if self.use_splice and self.read_fd != -1:
+            os.close(self.read_fd)
+            os.close(self.write_fd)
+            self.read_fd = self.write_fd = -1
+
+    def wants_write(self):
+        return self.pending > 0
+
+    def pump(self):
+        if self.finished:
+            return
+
+        if self.use_splice:
+            self.fill_pipe()
+            self.drain_pipe()
+        else:
+            self.copy()
+
+        if self.eof and not self.pending and self.destination.socket != None:
+            self.finished = True
+            self.destination.shutdown_write()
+
+    def fill_pipe(self):
+        if self.eof or self.pending >= self.pipe_size or \
+                self.source.socket == None:
+            return
+
+        try:
+            received = os.splice(self.source.fileno(), self.write_fd,
+                                 self.pipe_size - self.pending, flags=SPLICE_FLAGS)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+
+        if not received:
+            self.eof = True
+            self.source.hold_reading(self)
+            return
+
+        self.pending += received
+        self.source.downloaded_bytes += received
+
+        if self.pending >= self.pipe_size:
+            self.source.hold_reading(self)
+
+    def drain_pipe(self):
+        # Anything the destination queued itself must be written first.
+        if not self.pending or self.destination.write_queue or \
+                not self.destination.can_write():
+            return
+
+        try:
+            sent = os.splice(self.read_fd, self.destination.fileno(),
+                             self.pending, flags=SPLICE_FLAGS)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+
+        self.pending -= sent
+        self.destination.uploaded_bytes += sent
+
+        if not self.eof and self.pending < self.pipe_size:
+            self.source.release_reading(self)
+
+    def copy(self):
+        destination = self.destination
+
+        if destination.write_buffer_size >= destination.write_buffer_high_watermark:
+            self.source.hold_reading(self)
+            return
+
+        if not self.eof:
+            self.source.release_reading(self)
+
+        if self.eof or self.source.socket == None:
+            return
+
+        try:
+            data = self.source.recv(self.pipe_size)
+        except (IOError, OSError) as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+
+        if data is None:
+            return
+
+        if not data:
+            self.eof = True
+            self.source.hold_reading(self)
+            return
+
+        self.source.downloaded_bytes += len(data)
+        destination.send(data)
+
+
+class TCPRelay(object):
+    """
+    Relays data between two connected TCPSockets in both directions, for
+    example to forward connections to a backend.
+
+    On Linux the data is moved with `os.splice` and never copied into
+    Python. While one side can't keep up, the other side is no longer read
+    so the backpressure reaches the sender. When one side finishes sending,
+    the other sides write side is shut down once the data has been
+    relayed, and both sockets are closed once both directions have
+    finished. Closing either socket closes the other.
+
+    Any data already received into the sockets read buffers is relayed
+    first, the delegates won't receive data while the relay is running.
+    """
+
+    def __init__(self, first, second, pipe_size=64 * 1024):
+        self.sockets = (first, second)
+        self.directions = (
+            RelayDirection(first, second, pipe_size),
+            RelayDirection(second, first, pipe_size),
+        )
+
+        for sock, other in ((first, second), (second, first)):
+            sock.relay = self
+
+            pending = sock.read_buffer
+            if pending:
+                sock.read_buffer = bytes()
+                other.send(pending)
+
+        self.pump()
+
+    def direction_to(self, sock):
+        if sock is self.sockets[1]:
+            return self.directions[0]
+        return self.directions[1]
+
+    def wants_write(self, sock):
+        return self.direction_to(sock).wants_write()
+
+    def pump(self):
+        for direction in self.directions:
+            try:
+                direction.pump()
+            except (IOError, OSError) as e:
+                return self.close(e)
+
+        if all(direction.finished for direction in self.directions):
+            return self.close()
+
+        for sock in self.sockets:
+            if sock.socket != None:
+                sock.runloop.update_socket(sock)
+
+    def socket_did_close(self, sock):
+        self.close()
+
+    def close(self, err=None):
+        """
+        Stop relaying and close both sockets.
+        """
+
+        for sock in self.sockets:
+            if sock.relay is self:
+                sock.relay = None
+
+        for direction in self.directions:
+            direction.close()
+
+        for sock in self.sockets:
+            if sock.socket != None:
+                sock.close(err)
@@ -0,0 +1,136 @@
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from zokket.runloop import DefaultRunloop, monotonic
+
+
+def is_ip_address(host):
+    for family in (socket.AF_INET, getattr(socket, 'AF_INET6', None)):
+        if family is None:
+            continue
+
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except (socket.error, ValueError, TypeError):
+            pass
+
+    return False
+
+
+def address_family(host):
+    """
+    The address family of an IP address, IPv4 for anything else.
+    """
+
+    if hasattr(socket, 'AF_INET6') and ':' in host:
+        return socket.AF_INET6
+    return socket.AF_INET
+
+
+def unmap_address(host):
+    """
+    Convert an IPv4-mapped IPv6 address, as reported by dual-stack sockets
+    for IPv4 peers, to the plain IPv4 address.
+    """
+
+    if host.startswith('::ffff:') and '.' in host:
+        return host[7:]
+    return host
+
+
+class Resolver(object):
+    """
+    Resolves host names with `getaddrinfo` on a thread pool so lookups
+    don't block the runloop, the callback is called back on the runloop
+    which requested the lookup.
+
+    Results are cached for `ttl` seconds and failed lookups for
+    `negative_ttl` seconds. Concurrent lookups of the same name share a
+    single `getaddrinfo` call.
+    """
+
+    def __init__(self, max_workers=4, ttl=60, negative_ttl=5,
+            max_entries=1024):
+        self.pool = ThreadPoolExecutor(max_workers)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.pending = {}
+
+    @classmethod
+    def default(cls):
+        if not hasattr(cls, '_resolver'):
+            cls._resolver = cls()
+        return cls._resolver
+
+    def resolve(self, host, port, callback, family=socket.AF_UNSPEC,
+            runloop=None):
+        """
+        Look up host, calling the callback on the runloop with a list of
+        (family, address) tuples and None, or with None and the error.
+        """
+
+        runloop = runloop or DefaultRunloop.default()
+        key = (host, port, family)
+
+        with self.lock:
+            entry = self.cache.get(key)
+
+            if entry is not None:
+                expires, addresses, err = entry
+
+                if expires > monotonic():
+                    runloop.call_soon(callback, addresses, err)
+                    return
+
+                del self.cache[key]
+
+            waiters = self.pending.get(key)
+            if waiters is not None:
+                waiters.append((runloop, callback))
+                return
+
+            self.pending[key] = [(runloop, callback)]
+
+        future = self.pool.submit(self.lookup, host, port, family)
+        future.add_done_callback(lambda f: self.completed(key, f))
+
+    def lookup(self, host, port, family):
+        results = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+        return [(result[0], result[4]) for result in results]
+
+    def completed(self, key, future):
+        try:
+            addresses, err = future.result(), None
+            ttl = self.ttl
+        except socket.gaierror as e:
+            addresses, err = None, e
+            # Temporary failures aren't cached.
+            ttl = 0 if e.errno == socket.EAI_AGAIN else self.negative_ttl
+        except Exception as e:
+            addresses, err = None, e
+            ttl = 0
+
+        with self.lock:
+            if ttl:
+                if len(self.cache) >= self.max_entries:
+                    del self.cache[next(iter(self.cache))]
+
+                self.cache[key] = (monotonic() + ttl, addresses, err)
+
+            waiters = self.pending.pop(key)
+
+        for runloop, callback in waiters:
+            runloop.call_soon_threadsafe(callback, addresses, err)
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait)
@@ -1,5 +1,13 @@
+import errno
+import heapq
+import itertools
+import os
 import select
 import threading
+from collections import deque
+from time import monotonic
+
+from zokket.instrumentation import RunloopInstrumentation, perf_counter
 
 class DefaultRunloop(object):
     @classmethod
@@ -25,6 +33,9 @@ class DefaultRunloop(object):
         cls.default().running = False
 
 class BaseRunloop(object):
+    edge_triggered = False
+    instrumentation = None
+
     @classmethod
     def set_default(cls):
         DefaultRunloop.set(cls)
@@ -38,6 +49,14 @@ class BaseRunloop(object):
     def unregister_socket(self, socket):
         return
 
+    def adopt_socket(self, socket):
+        """
+        Move a newly accepted socket onto this runloop.
+        """
+
+        socket.runloop = self
+        socket.configure()
+
     def update_socket(self, socket):
         """
         This is called when the state of a socket changes, when
@@ -46,57 +65,311 @@ class BaseRunloop(object):
         return
 
 class TimerRunloopMixin(object):
+    """
+    Schedules timers on a min-heap ordered by their monotonic fire time.
+
+    Unregistering a timer only marks its heap entry as cancelled, the entry
+    is discarded once it reaches the top of the heap. This keeps registering,
+    cancelling and finding the next deadline logarithmic or better.
+    """
+
     def __init__(self):
-        self.timers = []
+        self.timers = {}
+        self.timer_heap = []
+        self.timer_counter = itertools.count()
+        self.cancelled_timers = 0
 
     def register_timer(self, timer):
-        if timer not in self.timers:
-            self.timers.append(timer)
+        if timer in self.timers:
+            self.cancel_timer_entry(self.timers.pop(timer))
+
+        entry = [timer.fire_at, next(self.timer_counter), timer]
+        self.timers[timer] = entry
+        heapq.heappush(self.timer_heap, entry)
 
     def unregister_timer(self, timer):
-        if timer in self.timers:
-            self.timers.remove(timer)
+        entry = self.timers.pop(timer, None)
+        if entry is not None:
+            self.cancel_timer_entry(entry)
+
+    def cancel_timer_entry(self, entry):
+        entry[-1] = None
+        self.cancelled_timers += 1
+
+        # Rebuild the heap once most of it is cancelled so a burst of
+        # cancellations (such as connect timeouts) can't grow it unbounded.
+        if self.cancelled_timers > 64 and \
+                self.cancelled_timers > len(self.timer_heap) // 2:
+            self.timer_heap = [e for e in self.timer_heap if e[-1] is not None]
+            heapq.heapify(self.timer_heap)
+            self.cancelled_timers = 0
+
+    def next_timer_entry(self):
+        while self.timer_heap and self.timer_heap[0][-1] is None:
+            heapq.heappop(self.timer_heap)
+            self.cancelled_timers -= 1
+
+        if self.timer_heap:
+            return self.timer_heap[0]
 
     def run_timers(self):
-        [timer.execute() for timer in self.timers if timer.timeout() <= 0.0]
+        now = monotonic()
+        repeating = []
+
+        while True:
+            entry = self.next_timer_entry()
+            if entry is None or entry[0] > now:
+                break
+
+            heapq.heappop(self.timer_heap)
+            timer = entry[-1]
+            del self.timers[timer]
+
+            instrumentation = self.instrumentation
+            if instrumentation is None:
+                timer.execute()
+            else:
+                instrumentation.timer_lateness.record(now - entry[0])
+
+                start = perf_counter()
+                timer.execute()
+                instrumentation.record_handler(timer, timer.callback, perf_counter() - start)
+
+            if timer.repeat:
+                repeating.append(timer)
+
+        # Repeating timers are rescheduled after the pass so that a timer
+        # with a zero interval can't keep this loop running forever.
+        for timer in repeating:
+            if timer.repeat and timer not in self.timers:
+                self.register_timer(timer)
 
     def timer_timeout(self):
-        try:
-            runtimes = [timer.timeout() for timer in self.timers]
-            runtimes.sort()
-            timeout = runtimes.pop(0)
-            if timeout < 0.0:
-                return 0
-            return timeout
-        except:
+        entry = self.next_timer_entry()
+        if entry is None:
             return 180
 
+        return max(entry[0] - monotonic(), 0)
+
+
+class Waker(object):
+    """
+    Wakes up a runloop which is blocked waiting for network events. The
+    waker is registered with the runloop like a socket and is backed by an
+    eventfd where available, and a pipe otherwise.
+    """
+
+    def __init__(self):
+        if hasattr(os, 'eventfd'):
+            self.read_fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            self.write_fd = self.read_fd
+        else:
+            self.read_fd, self.write_fd = os.pipe()
+            for fd in (self.read_fd, self.write_fd):
+                os.set_blocking(fd, False)
+
+        self.runloop = None
+        self.woken = False
+
+    def __del__(self):
+        if self.read_fd != self.write_fd:
+            os.close(self.write_fd)
+        os.close(self.read_fd)
+
+    def wake(self):
+        # Only the first wake up before the runloop drains the waker needs
+        # a system call.
+        if self.woken:
+            return
+
+        self.woken = True
+
+        try:
+            if self.read_fd == self.write_fd:
+                os.eventfd_write(self.write_fd, 1)
+            else:
+                os.write(self.write_fd, b'\0')
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def close(self):
+        if self.runloop:
+            self.runloop.unregister_socket(self)
+            self.runloop = None
+
+    # Runloop Callbacks
+
+    def fileno(self):
+        return self.read_fd
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def handle_read_event(self):
+        try:
+            if self.read_fd == self.write_fd:
+                os.eventfd_read(self.read_fd)
+            else:
+                while os.read(self.read_fd, 4096):
+                    pass
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+        self.woken = False
+
+    def handle_write_event(self):
+        pass
+
+    def handle_except_event(self):
+        pass
+
+
 class Runloop(BaseRunloop, TimerRunloopMixin):
+    # The seconds run() waits for sockets to write their queued data once
+    # the runloop was stopped, or None to wait until it has been written.
+    shutdown_timeout = 30
+
     def __init__(self):
         super(Runloop, self).__init__()
         self.sockets = []
         self.running = False
+        self.callbacks = deque()
+        self.waker = Waker()
 
     def run(self):
         self.running = True
 
+        self.waker.runloop = self
+        self.register_socket(self.waker)
+
         try:
             while self.running:
-                self.run_network()
-                self.run_timers()
+                instrumentation = self.instrumentation
+
+                if instrumentation is None:
+                    self.run_network()
+                    self.run_timers()
+                    self.run_callbacks()
+                else:
+                    start = perf_counter()
+                    self.run_network()
+                    self.run_timers()
+                    self.run_callbacks()
+
+                    instrumentation.iterations += 1
+                    instrumentation.iteration_time.record(
+                        perf_counter() - start - instrumentation.last_poll_wait)
         except (KeyboardInterrupt, SystemExit):
             self.running = False
 
         self.shutdown()
 
+        # Sockets finish writing their queued data before they close, the
+        # timers have to keep running for rate limited sockets. Don't wait
+        # forever for peers which stop reading.
+        deadline = None
+        if self.shutdown_timeout is not None:
+            from zokket.timers import Timer
+            deadline = Timer(self.shutdown_timeout, self.abort_sockets, runloop=self)
+
         while len(self.sockets):
             self.run_network()
+            self.run_timers()
+            self.run_callbacks()
+
+        if deadline is not None:
+            deadline.invalidate()
+
+    def abort_sockets(self, timer=None):
+        """
+        Close the sockets which are still writing queued data after the
+        runloop was stopped, without waiting for the data to be written.
+        """
+
+        err = TimeoutError('Timed out writing queued data')
+
+        for sock in list(self.sockets):
+            sock.close(err)
+
+    def stop(self):
+        """
+        Stop the runloop, this may be called from any thread.
+        """
+
+        self.running = False
+        self.waker.wake()
 
     def run_network(self):
         raise NotImplemented
 
+    def enable_instrumentation(self, slow_callback_threshold=0.1):
+        """
+        Start recording how the runloop spends its time, see
+        RunloopInstrumentation.
+        """
+
+        self.instrumentation = RunloopInstrumentation(slow_callback_threshold)
+        return self.instrumentation
+
+    def disable_instrumentation(self):
+        self.instrumentation = None
+
+    def wait_for_events(self, poll, *args):
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return poll(*args)
+
+        start = perf_counter()
+        events = poll(*args)
+        instrumentation.record_poll(perf_counter() - start, events)
+        return events
+
+    def poll_timeout(self):
+        if self.callbacks:
+            return 0
+        return self.timer_timeout()
+
+    def call_soon(self, callback, *args):
+        """
+        Call the callback with args on the next iteration of the runloop.
+        This must be called from the thread running the runloop.
+        """
+
+        self.callbacks.append((callback, args))
+
+    def call_soon_threadsafe(self, callback, *args):
+        """
+        Call the callback with args on the next iteration of the runloop,
+        waking the runloop up if it is waiting for network events. This
+        may be called from any thread.
+        """
+
+        self.callbacks.append((callback, args))
+        self.waker.wake()
+
+    def run_callbacks(self):
+        # Only run the callbacks that are queued now, callbacks scheduled
+        # by these will run on the next iteration.
+        instrumentation = self.instrumentation
+
+        for i in range(len(self.callbacks)):
+            callback, args = self.callbacks.popleft()
+
+            if instrumentation is None:
+                callback(*args)
+            else:
+                instrumentation.call(self, callback, *args)
+
+    def adopt_socket(self, socket):
+        self.call_soon_threadsafe(super(Runloop, self).adopt_socket, socket)
+
     def shutdown(self):
-        [s.close() for s in self.sockets]
+        [s.close() for s in list(self.sockets)]
 
     def register_socket(self, socket):
         if socket not in self.sockets:
@@ -110,13 +383,19 @@ class SelectRunloop(Runloop):
     def run_network(self):
         r = filter(lambda x: x.readable(), self.sockets)
         w = filter(lambda x: x.writable(), self.sockets)
-        e = filter(lambda x: x.socket != None, self.sockets)
+        e = filter(lambda x: x.fileno() != -1, self.sockets)
 
-        (rlist, wlist, xlist) = select.select(r, w, e, self.timer_timeout())
+        (rlist, wlist, xlist) = self.wait_for_events(select.select, r, w, e, self.poll_timeout())
 
-        [s.handle_except_event() for s in xlist]
-        [s.handle_read_event() for s in rlist]
-        [s.handle_write_event() for s in wlist]
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            [s.handle_except_event() for s in xlist]
+            [s.handle_read_event() for s in rlist]
+            [s.handle_write_event() for s in wlist]
+        else:
+            [instrumentation.call(s, s.handle_except_event) for s in xlist]
+            [instrumentation.call(s, s.handle_read_event) for s in rlist]
+            [instrumentation.call(s, s.handle_write_event) for s in wlist]
 
 
 class PollRunloop(Runloop):
@@ -126,21 +405,35 @@ class PollRunloop(Runloop):
 
     def socket_for_fd(self, fd):
         for socket in self.sockets:
-            if socket == fd:
+            if socket.fileno() == fd:
                 return socket
 
     def run_network(self):
-        for fd, flag in self.poll.poll():
+        instrumentation = self.instrumentation
+
+        for fd, flag in self.wait_for_events(self.poll.poll, self.poll_timeout() * 1000):
             socket = self.socket_for_fd(fd)
             if socket is None:
                 continue
 
+            handlers = []
+
             if flag & (select.POLLIN | select.POLLPRI):
-                socket.handle_read_event()
-            elif flag & select.POLLOUT:
-                socket.handle_write_event()
-            elif flag & select.POLLERR:
-                socket.handle_except_event()
+                handlers.append(socket.handle_read_event)
+            if flag & select.POLLOUT:
+                handlers.append(socket.handle_write_event)
+            if flag & select.POLLERR:
+                handlers.append(socket.handle_except_event)
+
+            for handler in handlers:
+                # A handler may have closed the socket.
+                if self.socket_for_fd(fd) is not socket:
+                    break
+
+                if instrumentation is None:
+                    handler()
+                else:
+                    instrumentation.call(socket, handler)
 
     def eventmask(self, socket):
         mask = select.POLLERR | select.POLLHUP | select.POLLPRI
@@ -164,3 +457,121 @@ class PollRunloop(Runloop):
     def unregister_socket(self, socket):
         super(PollRunloop, self).unregister_socket(socket)
         self.poll.unregister(socket)
+
+
+class EpollRunloop(Runloop):
+    """
+    A run loop that uses the Linux `epoll()` system call. Sockets are kept in
+    a dictionary indexed by file descriptor, so registering a socket and
+    dispatching an event are O(1) regardless of how many sockets are open.
+
+    When `edge_triggered` is True, sockets are only notified when their state
+    changes and will drain their file descriptor on each event.
+    """
+
+    def __init__(self, edge_triggered=False):
+        super(EpollRunloop, self).__init__()
+        self.edge_triggered = edge_triggered
+        self.epoll = select.epoll()
+        self.fd_map = {}
+        self.fd_masks = {}
+
+        # Runloop.run() and shutdown() only need to iterate and count the
+        # registered sockets, a live view of the registry is enough.
+        self.sockets = self.fd_map.values()
+
+    def run_network(self):
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            return self.run_network_instrumented(instrumentation)
+
+        for fd, flag in self.epoll.poll(self.poll_timeout()):
+            socket = self.fd_map.get(fd)
+            if socket is None:
+                continue
+
+            if flag & (select.EPOLLIN | select.EPOLLPRI | select.EPOLLHUP):
+                socket.handle_read_event()
+
+            if flag & select.EPOLLOUT and self.fd_map.get(fd) is socket:
+                socket.handle_write_event()
+
+            if flag & select.EPOLLERR and self.fd_map.get(fd) is socket:
+                socket.handle_except_event()
+
+    def run_network_instrumented(self, instrumentation):
+        for fd, flag in self.wait_for_events(self.epoll.poll, self.poll_timeout()):
+            socket = self.fd_map.get(fd)
+            if socket is None:
+                continue
+
+            if flag & (select.EPOLLIN | select.EPOLLPRI | select.EPOLLHUP):
+                instrumentation.call(socket, socket.handle_read_event)
+
+            if flag & select.EPOLLOUT and self.fd_map.get(fd) is socket:
+                instrumentation.call(socket, socket.handle_write_event)
+
+            if flag & select.EPOLLERR and self.fd_map.get(fd) is socket:
+                instrumentation.call(socket, socket.handle_except_event)
+
+    def eventmask(self, socket):
+        mask = 0
+
+        if socket.readable():
+            mask |= select.EPOLLIN | select.EPOLLPRI
+
+        if socket.writable():
+            mask |= select.EPOLLOUT
+
+        if self.edge_triggered:
+            mask |= select.EPOLLET
+
+        return mask
+
+    def register_socket(self, socket):
+        fd = socket.fileno()
+        if fd < 0:
+            return
+
+        mask = self.eventmask(socket)
+
+        if fd in self.fd_map:
+            try:
+                self.epoll.modify(fd, mask)
+            except (IOError, OSError):
+                # The previous owner of this fd was closed without being
+                # unregistered, the kernel has already forgotten about it.
+                self.epoll.register(fd, mask)
+        else:
+            self.epoll.register(fd, mask)
+
+        self.fd_map[fd] = socket
+        self.fd_masks[fd] = mask
+
+    def update_socket(self, socket):
+        fd = socket.fileno()
+        if self.fd_map.get(fd) is not socket:
+            return
+
+        mask = self.eventmask(socket)
+        if self.fd_masks[fd] != mask:
+            self.epoll.modify(fd, mask)
+            self.fd_masks[fd] = mask
+
+    def unregister_socket(self, socket):
+        fd = socket.fileno()
+
+        if self.fd_map.get(fd) is not socket:
+            # The socket may have already been closed, fall back to finding
+            # it by identity.
+            fd = next((k for k, v in self.fd_map.items() if v is socket), None)
+            if fd is None:
+                return
+
+        del self.fd_map[fd]
+        del self.fd_masks[fd]
+
+        try:
+            self.epoll.unregister(fd)
+        except (IOError, OSError, ValueError):
+            pass
@@ -0,0 +1,156 @@
+__all__ = ['TokenBucket', 'RateLimiter', 'set_global_limiter']
+
+from zokket.runloop import monotonic
+
+UPLOAD = 'upload'
+DOWNLOAD = 'download'
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` bytes per second on average, with bursts of up to `burst`
+    bytes. By default the burst is a second worth of tokens.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = max(burst if burst is not None else rate, 1)
+        self.tokens = float(self.burst)
+        self.updated = monotonic()
+
+    def refill(self):
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        self.refill()
+        return max(int(self.tokens), 0)
+
+    def consume(self, amount):
+        """
+        Take amount tokens from the bucket. A datagram can't be split, so
+        the bucket may be overdrawn and refills the debt first.
+        """
+
+        self.refill()
+        self.tokens -= amount
+
+    def delay(self, amount):
+        """
+        The seconds until amount tokens are available.
+        """
+
+        self.refill()
+        return max(amount - self.tokens, 0) / self.rate
+
+
+class RateLimiter(object):
+    """
+    Token bucket limits for uploading and downloading, in bytes per second.
+    A limiter can be added to the `rate_limiters` of a single socket,
+    shared between a group of sockets, or set for every socket with
+    `set_global_limiter`.
+
+    A socket takes at most `quantum` bytes at a time from a limiter and
+    waits on a runloop timer while the limiter is empty, so sockets sharing
+    a limiter take turns instead of a bulk transfer using up every token.
+    """
+
+    def __init__(self, upload=None, download=None, burst=None, quantum=16 * 1024):
+        self.upload = TokenBucket(upload, burst) if upload else None
+        self.download = TokenBucket(download, burst) if download else None
+        self.quantum = quantum
+
+    def __repr__(self):
+        rates = ('{}={}'.format(direction, int(bucket.rate))
+                 for direction, bucket in ((UPLOAD, self.upload), (DOWNLOAD, self.download))
+                 if bucket is not None)
+        return '<RateLimiter {}>'.format(' '.join(rates))
+
+    def bucket(self, direction):
+        if direction == UPLOAD:
+            return self.upload
+        return self.download
+
+
+global_limiter = None
+
+
+def set_global_limiter(limiter):
+    """
+    Limit the traffic of every socket with limiter, or stop limiting it
+    when limiter is None.
+    """
+
+    global global_limiter
+    global_limiter = limiter
+
+
+def limiters_for(sock):
+    if global_limiter is None:
+        return sock.rate_limiters
+    return list(sock.rate_limiters) + [global_limiter]
+
+
+def allowance(limiters, direction, size=None):
+    """
+    The amount of bytes, up to size, which the limiters allow to be
+    transferred in direction now. Nothing is allowed until a limiter holds
+    either size or a quantum worth of tokens, so a socket waits for a
+    reasonable amount instead of trickling a few bytes at a time.
+    """
+
+    for limiter in limiters:
+        bucket = limiter.bucket(direction)
+
+        if bucket is not None:
+            available = bucket.available()
+            wanted = limiter.quantum if size is None else min(size, limiter.quantum)
+
+            if available < min(wanted, bucket.burst):
+                return 0
+
+            size = min(available, wanted)
+
+    return size
+
+
+def ready(limiters, direction):
+    """
+    Whether the limiters allow anything to be transferred in direction.
+    """
+
+    for limiter in limiters:
+        bucket = limiter.bucket(direction)
+
+        if bucket is not None and not bucket.available():
+            return False
+
+    return True
+
+
+def consume(limiters, direction, amount):
+    for limiter in limiters:
+        bucket = limiter.bucket(direction)
+
+        if bucket is not None:
+            bucket.consume(amount)
+
+
+def delay(limiters, direction, amount=None):
+    """
+    The seconds until every limiter allows amount bytes in direction, by
+    default a quantum.
+    """
+
+    seconds = 0
+
+    for limiter in limiters:
+        bucket = limiter.bucket(direction)
+
+        if bucket is not None:
+            wanted = limiter.quantum if amount is None else amount
+            seconds = max(seconds, bucket.delay(min(wanted, bucket.burst)))
+
+    return seconds
@@ -2,6 +2,9 @@ __all__ = ['SocketException', 'TCPSocketDelegate', 'TCPSocket']
 
 import socket
 import os
+import mmap
+import tempfile
+from collections import deque
 
 try:
     import ssl
@@ -10,13 +13,125 @@ except ImportError:
 
 from zokket.timers import Timer
 from zokket.runloop import DefaultRunloop
+from zokket.framing import FramingError
+from zokket.resolver import Resolver, address_family, is_ip_address, unmap_address
+from zokket.connector import HappyEyeballs
+from zokket.options import get_profile
+from zokket.tls import TLSCache, TLSEngine
+from zokket.shaping import UPLOAD, DOWNLOAD, limiters_for, allowance, consume, delay
 
 import errno
+from itertools import islice, takewhile
+
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 16
+
+# Owners of the read holds for `pause_reading`, the `read_buffer_limit` and
+# the `rate_limiters`.
+READ_PAUSED = 'paused'
+READ_BUFFER_FULL = 'read buffer full'
+READ_RATE_LIMITED = 'rate limited'
 
 class SocketException(Exception):
     pass
 
 
+class FileTransfer(object):
+    """
+    A region of a file queued to be written by TCPSocket.send_file.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, fileobj, offset=0, count=None):
+        self.fileobj = fileobj
+        self.fd = fileobj.fileno()
+        self.offset = offset
+
+        if count is None:
+            count = os.fstat(self.fd).st_size - offset
+
+        self.remaining = max(count, 0)
+        self.use_sendfile = hasattr(os, 'sendfile')
+
+    def advance(self, size):
+        if size:
+            self.offset += size
+            self.remaining -= size
+        else:
+            # The file is shorter than expected.
+            self.remaining = 0
+
+    def sendfile(self, sock, count=None):
+        if count is None or count > self.remaining:
+            count = self.remaining
+
+        sent = os.sendfile(sock.fileno(), self.fd, self.offset, count)
+        self.advance(sent)
+        return sent
+
+    def read(self):
+        size = min(self.remaining, self.chunk_size)
+
+        if hasattr(os, 'pread'):
+            data = os.pread(self.fd, size, self.offset)
+        else:
+            self.fileobj.seek(self.offset)
+            data = self.fileobj.read(size)
+
+        self.advance(len(data))
+        return data
+
+
+class SpillFile(object):
+    """
+    A frame which is received into a memory mapped temporary file instead
+    of the read buffer, so it doesn't have to be held in memory.
+    """
+
+    def __init__(self, size, directory=None):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.file.truncate(size)
+        self.mmap = mmap.mmap(self.file.fileno(), size)
+        self.size = size
+        self.received = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def complete(self):
+        return self.received == self.size
+
+    def write(self, data):
+        self.mmap[self.received:self.received + len(data)] = data
+        self.received += len(data)
+
+    def recv_into(self, sock, size=None):
+        if size is None or size > self.size - self.received:
+            size = self.size - self.received
+
+        with memoryview(self.mmap)[self.received:] as view:
+            received = sock.recv_into(view, size)
+
+        self.received += received
+        return received
+
+    def memoryview(self):
+        """
+        A view of the frame, which must be released before the file is
+        closed.
+        """
+        return memoryview(self.mmap)
+
+    def close(self):
+        if not self.mmap.closed:
+            self.mmap.close()
+            self.file.close()
+
+
 class TCPSocketDelegate(object):
     """
     An instance of TCPSocket will call methods on its delegate object upon
@@ -43,13 +158,14 @@ class TCPSocketDelegate(object):
 
     def socket_wants_runloop_for_new_socket(self, sock, new_sock):
         """
-        If this method is not implemented then it will use the current runloop.
+        If this method is not implemented or returns None then it will use
+        the current runloop.
 
         This method can be implemented so the socket can run on a seperate
-        thread from the accept socket by returning a different runloop
-        running on a different thread.
+        thread from the accept socket by returning a RunloopGroup, which
+        hands the socket to one of its runloops.
         """
-        return RunLoop()
+        return None
 
     def socket_will_connect(self, sock):
         """
@@ -85,6 +201,26 @@ class TCPSocketDelegate(object):
         """
         pass
 
+    def socket_read_frames(self, sock, frames):
+        """
+        The sockets codec has decoded a list of frames out of the received
+        data. When this method isn't implemented, `socket_read_data` is
+        called for every frame instead.
+        """
+        pass
+
+    def socket_read_spilled_data(self, sock, spill):
+        """
+        The socket has received a frame larger than its `spill_threshold`
+        into a SpillFile. The frame is available as `spill.file` and
+        through `spill.memoryview()`, the delegate takes ownership and
+        should close the spill when it is done with it.
+
+        When this method isn't implemented, the frame is passed to
+        `socket_read_data` instead and closed afterwards.
+        """
+        pass
+
     def socket_address_in_use(self, sock, host, port):
         """
         This method will be called if the address you tried to
@@ -115,6 +251,36 @@ class TCPSocketDelegate(object):
         """
         pass
 
+    def socket_read_buffer_full(self, sock):
+        """
+        The received data which has not been consumed has passed the
+        sockets `read_buffer_limit`, so reading has been paused. Reading
+        resumes once the buffer is consumed, for example after changing
+        `read_until_data` and calling `resume_reading`.
+        """
+        pass
+
+    def socket_write_buffer_full(self, sock):
+        """
+        The data queued for writing has reached the sockets
+        `write_buffer_high_watermark`. Producers should stop sending
+        until `socket_write_buffer_drained` is called.
+        """
+        pass
+
+    def socket_write_buffer_drained(self, sock):
+        """
+        The data queued for writing has fallen to the sockets
+        `write_buffer_low_watermark` after the buffer was full.
+        """
+        pass
+
+    def socket_did_send_file(self, sock, fileobj):
+        """
+        A file queued with `send_file` has been written to the socket.
+        """
+        pass
+
 
 class TCPSocket(object):
     def __init__(self, delegate=None, runloop=None):
@@ -129,18 +295,56 @@ class TCPSocket(object):
         self.accepted = False
         self.closing = False
         self.connect_timeout = None
-
-        self.tls_handshake_stage = None
+        self.accept_budget = 64
+        self.resolver = None
+        self.resolving = False
+        self.connecting_address = None
+        self.tls_cache = None
+        self.address_family = socket.AF_UNSPEC
+        self.happy_eyeballs_delay = 0.25
+        self.connector = None
+        self.socket_options = None
+
+        self.tls = None
         self.tls_shutdown = False
+        self.tls_batch_size = 64 * 1024
 
         self.read_until_data = None
         self.read_until_length = None
+        self.codec = None
+        self.read_buffer_limit = None
         self.read_buffer = bytes()
+        self.read_chunk_size = 8192
+        self.read_as_memoryview = False
+        self.read_holds = set()
         self.buffer_type = 'utf-8'
 
+        self.spill_threshold = None
+        self.spill_directory = None
+        self.spill = None
+
+        self.write_queue = deque()
+        self.write_queue_encrypted = 0
+        self.write_buffer_size = 0
+        self.write_buffer_high_watermark = 64 * 1024
+        self.write_buffer_low_watermark = 16 * 1024
+        self.write_buffer_full = False
+        self.write_shutdown = False
+
+        self.relay = None
+
+        self.auto_cork = False
+        self.cork_threshold = 16 * 1024
+        self.cork_tcp = False
+        self.corked = False
+
         self.uploaded_bytes = 0
         self.downloaded_bytes = 0
 
+        self.rate_limiters = []
+        self.read_throttle = None
+        self.write_throttle = None
+
         self.runloop = runloop
 
     def __str__(self):
@@ -162,8 +366,10 @@ class TCPSocket(object):
                 self.local_host(),
                 self.local_port()
             )
-        elif self.socket != None:
+        elif self.socket != None or self.connector != None:
             return '<TCPSocket connecting>'
+        elif self.resolving:
+            return '<TCPSocket resolving>'
 
         return '<TCPSocket>'
 
@@ -203,68 +409,244 @@ class TCPSocket(object):
     def runloop(self, runloop):
         self._runloop = runloop
 
+    def apply_socket_options(self, sock, listening=False, accepted=False):
+        """
+        Set the `socket_options`, either SocketOptions or the name of a
+        registered profile, on a socket.socket. Accepted sockets inherit
+        the options of their listening socket.
+        """
+
+        options = get_profile(self.socket_options)
+        if options is not None:
+            options.apply(sock, listening, accepted)
+
+    @property
+    def resolver(self):
+        if not self._resolver:
+            self._resolver = Resolver.default()
+
+        return self._resolver
+
+    @resolver.setter
+    def resolver(self, resolver):
+        self._resolver = resolver
+
     # TLS
 
     def has_tls(self):
         return ssl is not None
 
+    @property
+    def tls_cache(self):
+        if not self._tls_cache:
+            self._tls_cache = TLSCache.default()
+
+        return self._tls_cache
+
+    @tls_cache.setter
+    def tls_cache(self, tls_cache):
+        self._tls_cache = tls_cache
+
     def start_tls(self, keyfile=None, certfile=None, cert_reqs=ssl.CERT_NONE, \
-            ca_certs=None, version=ssl.PROTOCOL_SSLv23):
+            ca_certs=None, version=ssl.PROTOCOL_SSLv23, context=None, \
+            server_hostname=None):
+        """
+        Start TLS negotiation, either with the SSLContext given as context
+        or with a context for the other arguments shared through the
+        `tls_cache`. Client sockets resume the last session with the same
+        host and port when possible.
+
+        The connection is encrypted by a TLSEngine, the socket itself stays
+        a plain socket. Data queued before TLS was started is written
+        without encryption.
+        """
+
         if not self.has_tls():
             return False
 
-        if self.socket is None:
+        if self.socket is None or self.tls is not None:
             return False
 
-        self.socket = ssl.SSLSocket(self.socket, keyfile=keyfile, \
-                                    certfile=certfile, cert_reqs=cert_reqs, \
-                                    ca_certs=ca_certs, ssl_version=version, \
-                                    server_side=self.accepted, \
-                                    do_handshake_on_connect=False)
+        server_side = self.accepted
+
+        if context is None:
+            context = self.tls_cache.context(server_side, keyfile, certfile,
+                                             cert_reqs, ca_certs, version)
+
+        session = None
+
+        if not server_side:
+            host, port = self.tls_session_address()
+
+            if server_hostname is None and host and not is_ip_address(host):
+                server_hostname = host
+
+            session = self.tls_cache.session(context, host, port)
+
+        self.tls = TLSEngine(context, server_side, server_hostname, session)
+        self.write_queue_encrypted = len(self.write_queue)
         self.tls_handshake()
 
         return True
 
+    def tls_session_address(self):
+        if self.connecting_address is not None:
+            return self.connecting_address
+        return (self.connected_host(), self.connected_port())
+
+    def store_tls_session(self):
+        if not self.accepted and self.tls is not None and self.tls.established:
+            host, port = self.tls_session_address()
+            self.tls_cache.store_session(self.tls.sslobj, host, port)
+
     def stop_tls(self):
-        self.tls_shutdown = True
+        """
+        End the TLS session, data queued until now is still written
+        encrypted. The connection continues without encryption once the
+        peer has ended the session too, returns True when it has.
+        """
+
+        if self.tls is None:
+            return False
+
+        if not self.tls_shutdown:
+            self.encrypt_write_queue()
+            self.tls_shutdown = True
+
+            # Data which is already received is still decrypted.
+            self.decrypt_tls()
 
         try:
-            self.socket = self.socket.unwrap()
-        except ssl.SSLError as err:
-            if err.args[0] == ssl.SSL_ERROR_WANT_READ:
-                self.tls_handshake_stage = 1
-                self.runloop.update_socket(self)
-                return False
-            elif err.args[0] == ssl.SSL_ERROR_WANT_WRITE:
-                self.tls_handshake_stage = 2
-                self.runloop.update_socket(self)
-                return False
-            else:
-                raise
+            done = self.tls.unwrap()
+        except ssl.SSLError as e:
+            self.close(e)
+            return False
 
-        self.tls_shutdown = False
-        self.tls_handshake_stage = None
+        self.queue_tls_output()
 
-        if self.closing:
+        if done:
+            data = self.tls.unused_data()
+
+            self.tls = None
+            self.tls_shutdown = False
+            self.write_queue_encrypted = 0
+
+            if data:
+                self.reserve_read_buffer(len(data))
+                self.read_storage[self.read_end:self.read_end + len(data)] = data
+                self.read_end += len(data)
+                self.dispatch_read_buffer()
+
+        self.flush()
+
+        if done and self.closing and self.socket != None:
             self.close()
-        else:
-            self.runloop.update_socket(self)
 
-        return True
+        return done
 
     def tls_cipher(self):
         if not self.has_tls():
             return
 
-        if isinstance(self.socket, ssl.SSLSocket):
-            return self.socket.cipher()
+        if self.tls is not None:
+            return self.tls.sslobj.cipher()
 
     def tls_peer_certificate(self, binary_form=False):
         if not self.has_tls():
             return
 
-        if isinstance(self.socket, ssl.SSLSocket):
-            return self.socket.getpeercert(binary_form)
+        if self.tls is not None:
+            return self.tls.sslobj.getpeercert(binary_form)
+
+    def tls_handshake(self):
+        """
+        Advance the TLS handshake, returns True once it has completed.
+        """
+
+        if not self.has_tls():
+            return False
+
+        try:
+            complete = self.tls.do_handshake()
+        except ssl.SSLError as e:
+            # Try to let the peer know with the alert the engine produced.
+            self.queue_tls_output()
+            self.flush()
+            self.close(e)
+            return False
+
+        self.queue_tls_output()
+
+        if complete:
+            self.tls_cache.record_handshake(self.tls.sslobj)
+            self.store_tls_session()
+
+        # Write the handshake records, and once the handshake is complete
+        # the data which was queued in the meantime.
+        self.flush()
+
+        if complete and self.socket != None:
+            self.socket_did_secure()
+
+        return complete
+
+    def queue_tls_output(self):
+        """
+        Queue the ciphertext produced by the TLS engine behind the
+        ciphertext which is already queued. Returns True when there was
+        any.
+        """
+
+        data = self.tls.ciphertext()
+
+        if data:
+            self.write_queue.insert(self.write_queue_encrypted, data)
+            self.write_queue_encrypted += 1
+            self.write_buffer_size += len(data)
+
+        return bool(data)
+
+    def encrypt_write_queue(self, size=None):
+        """
+        Encrypt the plaintext queued behind the ciphertext at the front of
+        the write queue, by default all of it. With size, about size bytes
+        are encrypted at a time so small writes are joined into a few large
+        TLS records. Returns False when TLS isn't established.
+        """
+
+        if not self.tls.established:
+            return False
+
+        index = self.write_queue_encrypted
+        buffers = []
+        encrypted = 0
+
+        while index < len(self.write_queue) and (size is None or encrypted < size):
+            data = self.write_queue[index]
+
+            if isinstance(data, FileTransfer):
+                chunk = data.read() if data.remaining else None
+
+                if not chunk:
+                    del self.write_queue[index]
+                    self.socket_did_send_file(data.fileobj)
+                    continue
+
+                data = chunk
+            else:
+                del self.write_queue[index]
+                self.write_buffer_size -= len(data)
+
+            buffers.append(data)
+            encrypted += len(data)
+
+        if len(buffers) > 1:
+            self.tls.write(b''.join(buffers))
+        elif buffers:
+            self.tls.write(buffers[0])
+
+        self.queue_tls_output()
+        return True
 
     # Connecting
 
@@ -283,27 +665,76 @@ class TCPSocket(object):
         #if not self.delegate:
         #    raise SocketException("Attempting to accept without a delegate. Set a delegate first.")
 
-        if self.socket != None:
+        if self.socket != None or self.resolving or self.connector != None:
             raise SocketException("Attempting to accept while connected or accepting connections. Disconnect first.")
 
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setblocking(0)
         self.connecting_address = (host, port)
 
+        if timeout:
+            self.connect_timeout = Timer(timeout, self.connection_timeout, False, (host, port), runloop=self.runloop)
+
+        if is_ip_address(host):
+            self.connect_to_address(address_family(host), (host, port))
+            return
+
+        # Resolve the host name on the resolvers threads, so a slow lookup
+        # doesn't block the runloop.
+        self.resolving = True
+        self.resolver.resolve(host, port, self.did_resolve,
+                              family=self.address_family, runloop=self.runloop)
+
+    def did_resolve(self, addresses, err):
+        if not self.resolving:
+            # The socket was closed while resolving.
+            return
+
+        self.resolving = False
+
+        if err is not None:
+            return self.close(err)
+
+        if len(addresses) == 1:
+            self.connect_to_address(*addresses[0])
+            return
+
+        # Race the addresses so a dead address doesn't cost a full connect
+        # timeout.
+        self.connector = HappyEyeballs(self, addresses, self.happy_eyeballs_delay)
+        self.connector.start()
+
+    def connector_did_connect(self, sock):
+        self.connector = None
+        self.socket = sock
+
+        self.runloop.register_socket(self)
+        self.did_connect()
+
+    def connector_did_fail(self, err):
+        self.connector = None
+
+        if getattr(err, 'errno', None) == errno.ECONNREFUSED:
+            self.socket_connection_refused()
+
+        self.close(err)
+
+    def connect_to_address(self, family, address):
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.setblocking(0)
+        self.apply_socket_options(self.socket)
+
         self.runloop.register_socket(self)
 
         try:
-            self.socket.connect((host, port))
+            self.socket.connect(address)
         except socket.error as e:
             if e.errno in (errno.EINPROGRESS, errno.EALREADY, errno.EWOULDBLOCK):
-                if timeout:
-                    self.connect_timeout = Timer(timeout, self.connection_timeout, False, (host, port), runloop=self.runloop)
                 return
             return self.close(e)
 
         self.did_connect()
 
     def connection_timeout(self, timer):
+        self.connect_timeout = None
         self.close()
         self.socket_connection_timeout(*timer.data)
 
@@ -313,33 +744,70 @@ class TCPSocket(object):
 
         if self.connect_timeout:
             self.connect_timeout.invalidate()
+            self.connect_timeout = None
 
         # Lets make sure that this connection wasn't refused.
 
-        try:
-            self.socket.recv(0)
-        except socket.error as e:
-            if e.errno == errno.ECONNREFUSED:
+        error = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            if error == errno.ECONNREFUSED:
                 self.socket_connection_refused()
-                self.close()
-                return
+            self.close(socket.error(error, os.strerror(error)))
+            return
 
         self.socket_did_connect()
 
-    def accept(self, host='', port=0):
+    def accept(self, host='', port=0, backlog=socket.SOMAXCONN, reuse_port=False):
+        """
+        Start listening for connections on host and port.
+
+        The backlog is the amount of connections the kernel will queue
+        while they are waiting to be accepted. When reuse_port is True, the
+        socket is bound with SO_REUSEPORT so that several processes can
+        listen on the same port and the kernel balances connections between
+        them.
+        """
+
         if not self.delegate:
             raise SocketException("Attempting to accept without a delegate. Set a delegate first.")
 
         if self.socket != None:
             raise SocketException("Attempting to accept while connected or accepting connections. Disconnect first.")
 
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        family = address_family(host)
+        bind_host = host
+
+        if not host and socket.has_ipv6:
+            # Listen on both IPv4 and IPv6.
+            family = socket.AF_INET6
+            bind_host = '::'
+
+        try:
+            self.socket = socket.socket(family, socket.SOCK_STREAM)
+        except socket.error:
+            if family != socket.AF_INET6 or host:
+                raise
+
+            family = socket.AF_INET
+            bind_host = host
+            self.socket = socket.socket(family, socket.SOCK_STREAM)
+
+        if family == socket.AF_INET6 and not host:
+            try:
+                self.socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+            except (AttributeError, socket.error):
+                pass
+
         self.socket.setblocking(0)
+        self.apply_socket_options(self.socket, listening=True)
+
+        if reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
         self.runloop.register_socket(self)
 
         try:
-            self.socket.bind((host, port))
+            self.socket.bind((bind_host, port))
         except socket.error as e:
             if e.errno == errno.EADDRINUSE:
                 self.close()
@@ -351,61 +819,94 @@ class TCPSocket(object):
                 return
             raise e
 
-        self.socket.listen(5)
+        self.socket.listen(backlog)
         self.accepting = True
         self.runloop.update_socket(self)
 
         self.socket_accepting(host, port)
 
     def accept_from_socket(self):
-        client, address = self.socket.accept()
+        """
+        Accept the pending connections, up to `accept_budget` per readiness
+        event so a burst of connections is absorbed in a few iterations
+        without starving the other sockets.
+        """
 
-        new_sock = self.__class__(self.delegate)
-        new_sock.socket = client
-        new_sock.socket.setblocking(0)
+        budget = self.accept_budget
 
-        self.socket_did_accept_new_socket(new_sock)
+        while self.socket != None:
+            try:
+                client, address = self.socket.accept()
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                if e.errno == errno.ECONNABORTED:
+                    continue
+                raise
 
-        runloop = self.socket_wants_runloop_for_new_socket(new_sock)
-        new_sock.runloop = runloop or self.runloop
-        new_sock.configure()
+            new_sock = self.__class__(self.delegate)
+            new_sock.socket = client
+            new_sock.socket.setblocking(0)
+            new_sock.socket_options = self.socket_options
+            new_sock.apply_socket_options(client, accepted=True)
 
-    def tls_handshake(self):
-        if not self.has_tls():
-            return
+            # Set before the delegate is told, so TLS can be started from
+            # socket_did_accept_new_socket as the server side.
+            new_sock.accepted = True
 
-        try:
-            self.socket.do_handshake()
-            self.tls_handshake_stage = None
-            self.runloop.update_socket(self)
+            self.socket_did_accept_new_socket(new_sock)
 
-            self.socket_did_secure()
-        except ssl.SSLError as err:
-            if err.args[0] == ssl.SSL_ERROR_WANT_READ:
-                self.tls_handshake_stage = 1
-                self.runloop.update_socket(self)
-            elif err.args[0] == ssl.SSL_ERROR_WANT_WRITE:
-                self.tls_handshake_stage = 2
-                self.runloop.update_socket(self)
+            runloop = self.socket_wants_runloop_for_new_socket(new_sock)
+
+            if runloop is None or runloop is self.runloop:
+                new_sock.runloop = self.runloop
+                new_sock.configure()
             else:
-                raise
+                runloop.adopt_socket(new_sock)
+
+            # An edge-triggered runloop won't notify us again until the
+            # accept queue has been drained, so the budget doesn't apply.
+            budget -= 1
+            if budget <= 0 and not self.edge_triggered():
+                return
 
     # Disconnect
 
     def close(self, err=None):
         """
         Disconnect or stop accepting.
+
+        Any data still queued for writing will be written before the socket
+        is closed, unless the socket is closed because of an error.
         """
 
+        if err is None and self.connected and self.write_queue and \
+                self.socket != None:
+            self.closing = True
+            self.runloop.update_socket(self)
+            return
+
+        if self.socket != None and err is None and self.tls is not None and \
+                self.tls.established and not self.tls.eof:
+            # Sessions may be issued after the handshake has completed.
+            self.store_tls_session()
+
+            try:
+                self.tls.unwrap()
+            except ssl.SSLError:
+                # The connection is broken, close it without a TLS shutdown.
+                pass
+            else:
+                # Close once the close_notify alert has been written.
+                self.queue_tls_output()
+                self.closing = True
+                self.flush()
+                return
+
         if (self.connected or self.accepted or self.accepting or err):
             self.socket_did_disconnect(err)
 
         if self.socket != None:
-            if isinstance(self.socket, ssl.SSLSocket):
-                if not self.stop_tls():
-                    self.closing = True
-                    return
-
             self.runloop.unregister_socket(self)
 
             self.socket.close()
@@ -414,6 +915,33 @@ class TCPSocket(object):
         self.closing = False
         self.connected = False
         self.accepting = False
+        self.resolving = False
+
+        self.tls = None
+        self.tls_shutdown = False
+        self.write_queue_encrypted = 0
+
+        if self.connector != None:
+            self.connector.cancel()
+            self.connector = None
+
+        if self.connect_timeout:
+            self.connect_timeout.invalidate()
+            self.connect_timeout = None
+
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+        for timer in (self.read_throttle, self.write_throttle):
+            if timer is not None:
+                timer.invalidate()
+
+        self.read_throttle = self.write_throttle = None
+        self.read_holds.discard(READ_RATE_LIMITED)
+
+        if self.relay is not None:
+            self.relay.socket_did_close(self)
 
     # Reading
 
@@ -421,77 +949,714 @@ class TCPSocket(object):
         if hasattr(self.delegate, 'socket_read_data'):
             self.delegate.socket_read_data(self, data)
 
-    def dequeue_buffer(self):
-        while self.read_buffer:
+    def read_frames(self, frames):
+        if hasattr(self.delegate, 'socket_read_frames'):
+            self.delegate.socket_read_frames(self, frames)
+        else:
+            for frame in frames:
+                self.read_data(frame)
+
+    def read_spilled_data(self, spill):
+        if hasattr(self.delegate, 'socket_read_spilled_data'):
+            self.delegate.socket_read_spilled_data(self, spill)
+            return
+
+        try:
+            with spill.memoryview() as data:
+                self.read_data(self.convert_read_data(data))
+        finally:
+            spill.close()
+
+    @property
+    def read_buffer(self):
+        """
+        The received data which has not been consumed yet.
+        """
+
+        return bytes(self.read_storage[self.read_start:self.read_end])
+
+    @read_buffer.setter
+    def read_buffer(self, data):
+        self.read_storage = bytearray(data)
+        self.read_start = 0
+        self.read_end = len(data)
+        self.read_search = (None, 0)
+        self.check_read_buffer()
+
+    def reserve_read_buffer(self, size):
+        """
+        Make room for at least size bytes after the received data, first by
+        moving unconsumed data to the front of the buffer and otherwise by
+        growing it.
+        """
+
+        if len(self.read_storage) - self.read_end >= size:
+            return
+
+        if self.read_start:
+            pending = self.read_end - self.read_start
+            self.read_storage[:pending] = self.read_storage[self.read_start:self.read_end]
+
+            delimiter, offset = self.read_search
+            self.read_search = (delimiter, max(offset - self.read_start, 0))
+            self.read_start = 0
+            self.read_end = pending
+
+        missing = self.read_end + size - len(self.read_storage)
+        if missing > 0:
+            self.read_storage.extend(bytes(max(missing, len(self.read_storage))))
+
+    def dequeue_frames(self):
+        """
+        Consume complete frames from the read buffer according to the
+        `codec`, `read_until_data` or `read_until_length`, yielding the start
+        and end offset of each frame in `read_storage`.
+        """
+
+        if self.codec is not None:
+            for frame in self.decode_frames():
+                yield frame
+
+            self.trim_read_buffer()
+            return
+
+        while self.read_start < self.read_end:
+            start = self.read_start
+
             if self.read_until_data != None:
-                index = self.read_buffer.find(self.read_until_data)
+                delimiter = self.read_until_data
+                if not isinstance(delimiter, bytes):
+                    delimiter = delimiter.encode(self.buffer_type or 'utf-8')
+
+                # Resume from where the last search for this delimiter
+                # stopped instead of rescanning the whole buffer.
+                searched_delimiter, offset = self.read_search
+                if searched_delimiter != delimiter or offset < start:
+                    offset = start
+
+                index = self.read_storage.find(delimiter, offset, self.read_end)
 
                 if index == -1:
+                    offset = max(self.read_end - len(delimiter) + 1, start)
+                    self.read_search = (delimiter, offset)
                     break
 
-                read_until_data_length = len(self.read_until_data)
-                data = self.read_buffer[:index + read_until_data_length]
-                self.read_buffer = self.read_buffer[index + read_until_data_length:]
-
-                yield data
+                end = index + len(delimiter)
             elif self.read_until_length != None:
-                if self.read_until_length > len(self.read_buffer):
+                end = start + self.read_until_length
+
+                if end > self.read_end:
                     break
+            else:
+                end = self.read_end
 
-                data = self.read_buffer[:self.read_until_length]
-                self.read_buffer = self.read_buffer[self.read_until_length:]
+            self.read_start = end
+            yield start, end
 
-                yield data
-            else:
-                data = self.read_buffer
-                self.read_buffer = bytes()
-                yield data
+        self.trim_read_buffer()
 
-    def bytes_availible(self):
-        if self.socket == None:
-            return
+    def decode_frames(self):
+        """
+        Decode every complete frame in the read buffer with the `codec` in a
+        single pass and consume them, returning the payload offsets.
+        """
+
+        frames, self.read_start = self.codec.decode(
+            self.read_storage, self.read_start, self.read_end)
+        return frames
+
+    def trim_read_buffer(self):
+        if self.read_start == self.read_end:
+            self.read_start = self.read_end = 0
+            self.read_search = (None, 0)
+
+            # Give back memory used to receive an unusually large frame.
+            if len(self.read_storage) > self.read_chunk_size * 16:
+                del self.read_storage[self.read_chunk_size:]
+
+    def dequeue_buffer(self):
+        for start, end in self.dequeue_frames():
+            yield bytes(self.read_storage[start:end])
+
+    def convert_read_data(self, view):
+        if self.read_as_memoryview:
+            # The view is only valid for the duration of the delegate call.
+            return view
+        elif self.buffer_type:
+            return str(view, self.buffer_type)
+        return view.tobytes()
+
+    def dispatch_read_buffer(self):
+        if self.codec is not None:
+            self.dispatch_frames()
+        else:
+            for start, end in self.dequeue_frames():
+                with memoryview(self.read_storage)[start:end] as data:
+                    self.read_data(self.convert_read_data(data))
+
+                if self.reading_paused:
+                    # The rest is dispatched by resume_reading.
+                    self.trim_read_buffer()
+                    break
+
+        self.check_read_buffer()
+
+    def dispatch_frames(self):
+        """
+        Decode the complete frames in the read buffer and hand them to the
+        delegate as one batch.
+        """
 
         try:
-            if isinstance(self.socket, ssl.SSLSocket):
-                data = self.socket.read(8192)
-            else:
-                data = self.socket.recv(8192)
-        except socket.error as e:
-            if e.errno in (errno.ECONNRESET, errno.ENOTCONN):
-                data = None
+            frames = self.decode_frames()
+        except FramingError as e:
+            return self.close(e)
+
+        if frames:
+            with memoryview(self.read_storage) as storage:
+                views = [storage[start:end] for start, end in frames]
+
+                try:
+                    self.read_frames([self.convert_read_data(view) for view in views])
+                finally:
+                    for view in views:
+                        view.release()
+
+        self.trim_read_buffer()
+
+    def hold_reading(self, owner):
+        """
+        Stop reading from the socket until every owner holding it has
+        called `release_reading`. Data which arrives in the meantime is
+        left in the kernels receive buffer, which pushes back on the peer.
+        """
+
+        if owner not in self.read_holds:
+            self.read_holds.add(owner)
+
+            if len(self.read_holds) == 1 and self.socket != None:
+                self.runloop.update_socket(self)
+
+    def release_reading(self, owner):
+        if owner in self.read_holds:
+            self.read_holds.remove(owner)
+
+            if not self.read_holds and self.socket != None:
+                self.runloop.update_socket(self)
+
+    @property
+    def reading_paused(self):
+        return READ_PAUSED in self.read_holds
+
+    def pause_reading(self):
+        """
+        Stop reading from the socket and stop passing buffered data to the
+        delegate until `resume_reading` is called, for example while the
+        consumer of the data can't keep up. The socket is taken out of the
+        runloops read interest, so the kernels receive buffer fills up and
+        TCP flow control pushes back on the peer.
+        """
+
+        self.hold_reading(READ_PAUSED)
+
+    def resume_reading(self):
+        """
+        Resume reading after `pause_reading`. Data which was already
+        received is passed to the delegate first.
+        """
+
+        self.release_reading(READ_PAUSED)
+
+        if self.socket != None and self.spill is None:
+            self.dispatch_read_buffer()
+
+    def check_read_buffer(self):
+        """
+        Pause reading while the received data which hasn't been consumed
+        is larger than `read_buffer_limit`, and resume once it's not.
+        """
+
+        if self.read_buffer_limit is None:
             return
 
-        if not data:
-            self.close()
+        if self.read_end - self.read_start > self.read_buffer_limit:
+            if READ_BUFFER_FULL not in self.read_holds:
+                self.hold_reading(READ_BUFFER_FULL)
+                self.socket_read_buffer_full()
         else:
-            self.read_buffer += data
-            self.downloaded_bytes += len(data)
+            self.release_reading(READ_BUFFER_FULL)
+
+    def should_spill(self):
+        return self.spill_threshold is not None and self.codec is None and \
+            self.tls is None and \
+            self.read_until_length != None and \
+            self.read_until_length > self.spill_threshold and \
+            self.read_end - self.read_start < self.read_until_length
+
+    def start_spill(self):
+        """
+        Receive the pending frame into a SpillFile, starting with the part
+        of it which is already in the read buffer.
+        """
+
+        self.spill = SpillFile(self.read_until_length, self.spill_directory)
+
+        with memoryview(self.read_storage)[self.read_start:self.read_end] as data:
+            self.spill.write(data)
+
+        self.read_start = self.read_end
+        self.trim_read_buffer()
+
+    def receive(self, size=None):
+        """
+        Receive up to size bytes, by default `read_chunk_size`, into the
+        read buffer, or the spill file while a large frame is being
+        received. Returns the amount of bytes received.
+        """
+
+        if size is None:
+            size = self.read_chunk_size
+
+        if self.tls is not None:
+            return self.receive_tls(size)
+
+        if self.spill is None and self.should_spill():
+            self.start_spill()
+
+        if self.spill is not None:
+            return self.spill.recv_into(self.socket, size)
+
+        self.reserve_read_buffer(size)
+
+        with memoryview(self.read_storage)[self.read_end:] as view:
+            received = self.socket.recv_into(view, size)
+
+        self.read_end += received
+        return received
+
+    def receive_tls(self, size):
+        """
+        Receive ciphertext and decrypt everything the TLS engine can into
+        the read buffer in one pass, so no decrypted data is left waiting
+        inside the engine where the runloop can't see it. Returns the
+        amount of bytes received.
+        """
+
+        data = self.socket.recv(size)
+
+        if not data:
+            self.tls.eof = True
+            return 0
+
+        self.tls.feed(data)
+
+        if not self.tls.handshake_complete and not self.tls_handshake():
+            return len(data)
+
+        if self.tls is None or self.socket == None:
+            return len(data)
+
+        self.decrypt_tls()
+
+        if self.tls_shutdown and self.tls.eof:
+            # The peer ended the TLS session too.
+            self.stop_tls()
 
-            for data in self.dequeue_buffer():
-                if self.buffer_type:
-                    data = data.decode(self.buffer_type)
+        return len(data)
 
-                self.read_data(data)
+    def decrypt_tls(self):
+        while True:
+            self.reserve_read_buffer(self.read_chunk_size)
+
+            with memoryview(self.read_storage)[self.read_end:] as view:
+                decrypted = self.tls.read_into(view)
+
+            if not decrypted:
+                break
+
+            self.read_end += decrypted
+
+        # Reading may produce records too, for example a key update.
+        if self.queue_tls_output():
+            self.flush()
+
+    def recv(self, size):
+        """
+        Receive data without passing it to the delegate, for example to
+        relay it. Up to size bytes are received, when TLS was started they
+        are decrypted which can return more data. Returns None when no data
+        is available yet and empty bytes at the end of the stream.
+        """
+
+        if self.tls is None:
+            return self.socket.recv(size)
+
+        if self.tls.eof:
+            return bytes()
+
+        received = self.receive()
+
+        data = self.read_buffer
+        self.read_start = self.read_end
+        self.trim_read_buffer()
+
+        if data:
+            return data
+
+        if not received or self.tls is None or self.tls.eof:
+            return bytes()
+
+        return None
+
+    def bytes_availible(self):
+        while self.socket != None:
+            size = self.rate_allowance(DOWNLOAD, self.read_chunk_size)
+            if size == 0:
+                self.throttle_reading()
+                return
+
+            try:
+                received = self.receive(size)
+            except ssl.SSLError as e:
+                self.close(e)
+                return
+            except socket.error as e:
+                return
+
+            if not received:
+                self.close()
+                return
+
+            self.downloaded_bytes += received
+            self.consume_rate_limit(DOWNLOAD, received)
+
+            if self.spill is not None:
+                if self.spill.complete:
+                    spill, self.spill = self.spill, None
+                    self.read_spilled_data(spill)
+            else:
+                self.dispatch_read_buffer()
+
+            if self.tls is not None and self.tls.eof:
+                # The peer ended the TLS session.
+                self.close()
+                return
+
+            # Keep reading until the socket would block when the runloop
+            # will not notify us of data that is already waiting. Once
+            # reading is held the runloop notifies us again when it's
+            # released.
+            if not self.edge_triggered() or self.read_holds:
+                return
 
     # Writing
 
     def send(self, data):
-        if self.tls_handshake_stage is not None:
-            return
+        """
+        Queue data to be written to the socket. Data is written straight
+        away when possible, anything the socket could not accept is kept
+        and written once the socket becomes writable again.
+
+        Data may also be a list or tuple of buffers, which are queued
+        without being joined and written with a single `sendmsg` call where
+        possible. Buffers are not copied, so a bytearray must not be
+        modified until it has been written.
+
+        Returns the amount of bytes queued.
+        """
+
+        if not self.can_queue():
+            return 0
 
-        self.uploaded_bytes += len(data)
+        if isinstance(data, (list, tuple)):
+            buffers = data
+        else:
+            buffers = (data,)
+
+        queued = 0
+
+        for data in buffers:
+            if isinstance(data, memoryview):
+                data = data.cast('B')
+            elif not isinstance(data, (bytes, bytearray)):
+                data = data.encode(self.buffer_type)
+
+            if data:
+                self.write_queue.append(data)
+                queued += len(data)
 
-        if not isinstance(data, bytes):
+        if not queued:
+            return 0
+
+        self.write_buffer_size += queued
+
+        if self.auto_cork and self.write_buffer_size < self.cork_threshold and \
+                hasattr(self.runloop, 'call_soon'):
+            if not self.corked:
+                self.corked = True
+                self.runloop.call_soon(self.uncork)
+        else:
+            self.flush()
+
+        return queued
+
+    def send_frame(self, data):
+        """
+        Frame data with the sockets `codec` and queue it to be written.
+        """
+
+        if not isinstance(data, (bytes, bytearray, memoryview)):
             data = data.encode(self.buffer_type)
 
-        try:
-            if isinstance(self.socket, ssl.SSLSocket):
-                return self.socket.write(data)
-            return self.socket.send(data)
-        except socket.error as e:
-            if e.errno == errno.EWOULDBLOCK:
-                return 0
-            raise e
+        return self.send(self.codec.encode(data))
+
+    def uncork(self):
+        """
+        Flush data which was held back by `auto_cork`.
+
+        When `auto_cork` is set, sends made while the runloop dispatches
+        events are gathered and written together at the end of the runloop
+        iteration, or as soon as `cork_threshold` bytes are queued. With
+        `cork_tcp` the socket is also corked with TCP_CORK while flushing so
+        the kernel only sends full segments.
+        """
+
+        self.corked = False
+
+        if not self.cork_tcp or not hasattr(socket, 'TCP_CORK') or \
+                not self.can_write():
+            self.flush()
+            return
+
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1)
+        self.flush()
+
+        if self.socket != None:
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 0)
+
+    def send_file(self, fileobj, offset=0, count=None):
+        """
+        Queue count bytes of fileobj, starting at offset, to be written to
+        the socket. By default the rest of the file is sent.
+
+        The file is written with `os.sendfile` as the socket becomes
+        writable, so its data never passes through Python. TLS sockets, or
+        files which sendfile does not support, are read and written a chunk
+        at a time instead. The `socket_did_send_file` delegate method is
+        called once the file has been written.
+        """
+
+        if not self.can_queue():
+            return 0
+
+        transfer = FileTransfer(fileobj, offset, count)
+        self.write_queue.append(transfer)
+
+        if not self.corked:
+            self.flush()
+
+        return transfer.remaining
+
+    def shutdown_write(self):
+        """
+        Shut down the write side of the connection once all queued data has
+        been written.
+        """
+
+        self.write_shutdown = True
+        self.flush()
+
+    def can_queue(self):
+        # Data sent while the host name is resolved, or while its addresses
+        # are raced, is written once the socket has connected.
+        return self.socket != None or self.resolving or self.connector != None
+
+    def can_write(self):
+        return self.socket != None and self.connected
+
+    def flush(self):
+        """
+        Write as much queued data as the socket will currently accept.
+        """
+
+        if not self.can_write():
+            self.check_write_buffer()
+            return
+
+        plain = self.tls is None
+        vectored = hasattr(self.socket, 'sendmsg')
+
+        while self.write_queue:
+            if not plain and not self.write_queue_encrypted:
+                # Encrypt the next batch of plaintext behind the ciphertext.
+                if not self.encrypt_write_queue(self.tls_batch_size):
+                    break
+                continue
+
+            data = self.write_queue[0]
+
+            if isinstance(data, FileTransfer):
+                if not data.remaining:
+                    self.write_queue.popleft()
+                    if self.write_queue_encrypted:
+                        self.write_queue_encrypted -= 1
+                    self.socket_did_send_file(data.fileobj)
+                    continue
+
+                if not plain or not data.use_sendfile:
+                    # Queue the next chunk of the file ahead of it.
+                    chunk = data.read()
+                    if chunk:
+                        self.write_queue.appendleft(chunk)
+                        self.write_buffer_size += len(chunk)
+                        if self.write_queue_encrypted:
+                            self.write_queue_encrypted += 1
+                    continue
+
+            if isinstance(data, FileTransfer):
+                allowed = self.rate_allowance(UPLOAD, data.remaining)
+            else:
+                allowed = self.rate_allowance(UPLOAD, len(data))
+
+            if allowed == 0:
+                self.throttle_writing()
+                break
+
+            try:
+                if isinstance(data, FileTransfer):
+                    sent = data.sendfile(self.socket, allowed)
+                elif vectored and allowed is None and len(self.write_queue) > 1 and \
+                        (plain or self.write_queue_encrypted > 1):
+                    sent = self.socket.sendmsg(self.queued_buffers())
+                elif allowed is not None and allowed < len(data):
+                    sent = self.socket.send(memoryview(data)[:allowed])
+                else:
+                    sent = self.socket.send(data)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    break
+                if isinstance(data, FileTransfer) and \
+                        e.errno in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+                    data.use_sendfile = False
+                    continue
+                return self.close(e)
+
+            self.uploaded_bytes += sent
+            self.consume_rate_limit(UPLOAD, sent)
+
+            if isinstance(data, FileTransfer):
+                continue
+
+            self.write_buffer_size -= sent
+
+            if self.consume_write_queue(sent):
+                break
+
+        self.runloop.update_socket(self)
+        self.check_write_buffer()
+
+        if not self.write_queue:
+            if self.write_shutdown and self.socket != None:
+                self.write_shutdown = False
+
+                try:
+                    self.socket.shutdown(socket.SHUT_WR)
+                except socket.error:
+                    pass
+
+            if self.closing:
+                self.close()
+
+    def queued_buffers(self):
+        """
+        The buffers at the front of the write queue, up to the first file.
+        """
+
+        buffers = takewhile(lambda data: not isinstance(data, FileTransfer),
+                            self.write_queue)
+
+        if self.tls is not None:
+            # Only the ciphertext, the plaintext behind it isn't encrypted yet.
+            return islice(buffers, min(IOV_MAX, self.write_queue_encrypted))
+
+        return islice(buffers, IOV_MAX)
+
+    def consume_write_queue(self, sent):
+        """
+        Remove sent bytes from the front of the write queue, returns True
+        when a buffer was only partially written.
+        """
+
+        while sent:
+            data = self.write_queue[0]
+
+            if sent < len(data):
+                self.write_queue[0] = memoryview(data)[sent:]
+                return True
+
+            sent -= len(data)
+            self.write_queue.popleft()
+
+            if self.write_queue_encrypted:
+                self.write_queue_encrypted -= 1
+
+        return False
+
+    def check_write_buffer(self):
+        if not self.write_buffer_full:
+            if self.write_buffer_size >= self.write_buffer_high_watermark:
+                self.write_buffer_full = True
+                self.socket_write_buffer_full()
+        elif self.write_buffer_size <= self.write_buffer_low_watermark:
+            self.write_buffer_full = False
+            self.socket_write_buffer_drained()
+
+    # Rate Limiting
+
+    def rate_allowance(self, direction, size=None):
+        """
+        The amount of bytes, up to size, the `rate_limiters` and the global
+        limiter allow to be transferred now, None when there is no limit.
+        """
+
+        limiters = limiters_for(self)
+        if not limiters:
+            return None
+
+        return allowance(limiters, direction, size)
+
+    def consume_rate_limit(self, direction, amount):
+        limiters = limiters_for(self)
+        if limiters:
+            consume(limiters, direction, amount)
+
+    def throttle_reading(self):
+        """
+        Stop reading until the rate limiters allow it again.
+        """
+
+        if self.read_throttle is None:
+            self.hold_reading(READ_RATE_LIMITED)
+            self.read_throttle = Timer(delay(limiters_for(self), DOWNLOAD),
+                                       self.unthrottle_reading, runloop=self.runloop)
+
+    def unthrottle_reading(self, timer):
+        self.read_throttle = None
+        self.release_reading(READ_RATE_LIMITED)
+
+    def throttle_writing(self):
+        """
+        Stop writing until the rate limiters allow it again.
+        """
+
+        if self.write_throttle is None:
+            self.write_throttle = Timer(delay(limiters_for(self), UPLOAD),
+                                        self.unthrottle_writing, runloop=self.runloop)
+            self.runloop.update_socket(self)
+
+    def unthrottle_writing(self, timer):
+        self.write_throttle = None
+        self.flush()
 
     # Diagnostics
 
@@ -505,7 +1670,7 @@ class TCPSocket(object):
             return ''
 
         try:
-            return self.socket.getpeername()[0]
+            return unmap_address(self.socket.getpeername()[0])
         except socket.error:
             return ''
 
@@ -523,7 +1688,7 @@ class TCPSocket(object):
             return ''
 
         try:
-            return self.socket.getsockname()[0]
+            return unmap_address(self.socket.getsockname()[0])
         except socket.error:
             return ''
 
@@ -538,31 +1703,51 @@ class TCPSocket(object):
 
     # Runloop Callbacks
 
+    def edge_triggered(self):
+        return getattr(self.runloop, 'edge_triggered', False)
+
     def readable(self):
-        return self.socket != None
+        if self.socket == None:
+            return False
+
+        if self.tls is not None and \
+                (not self.tls.handshake_complete or self.tls_shutdown):
+            # Waiting for the handshake, or for the peer to end TLS.
+            return True
+
+        if self.closing:
+            # Only waiting for queued data to be written before closing.
+            return False
+
+        return not self.read_holds
 
     def writable(self):
         if self.socket != None:
-            if self.tls_handshake_stage == 2:
-                return True
             if not self.accepting:
-                return not self.connected
+                if not self.connected:
+                    return True
+                if self.write_throttle is not None:
+                    return False
+                if self.relay is not None and self.relay.wants_write(self):
+                    return True
+                if self.tls is not None and not self.write_queue_encrypted and \
+                        not self.tls.established:
+                    # The queued plaintext can't be encrypted yet.
+                    return False
+                return bool(self.write_queue)
         return False
 
     def handle_read_event(self):
         if self.socket == None:
             return
 
-        if self.tls_handshake_stage is not None:
-            if self.tls_shutdown:
-                self.stop_tls()
-            else:
-                self.tls_handshake()
-        elif self.accepting:
+        if self.accepting:
             self.accept_from_socket()
         elif not self.connected:
             self.did_connect()
             self.bytes_availible()
+        elif self.relay is not None:
+            self.relay.pump()
         else:
             self.bytes_availible()
 
@@ -570,13 +1755,13 @@ class TCPSocket(object):
         if self.socket == None:
             return
 
-        if self.tls_handshake_stage is not None:
-            if self.tls_shutdown:
-                self.stop_tls()
-            else:
-                self.tls_handshake()
-        elif not self.connected and not self.accepting:
+        if not self.connected and not self.accepting:
             self.did_connect()
+        elif self.connected:
+            self.flush()
+
+            if self.relay is not None:
+                self.relay.pump()
 
     def handle_except_event(self):
         pass
@@ -625,3 +1810,19 @@ class TCPSocket(object):
     def socket_did_secure(self):
         if hasattr(self.delegate, 'socket_did_secure'):
             self.delegate.socket_did_secure(self)
+
+    def socket_read_buffer_full(self):
+        if hasattr(self.delegate, 'socket_read_buffer_full'):
+            self.delegate.socket_read_buffer_full(self)
+
+    def socket_write_buffer_full(self):
+        if hasattr(self.delegate, 'socket_write_buffer_full'):
+            self.delegate.socket_write_buffer_full(self)
+
+    def socket_write_buffer_drained(self):
+        if hasattr(self.delegate, 'socket_write_buffer_drained'):
+            self.delegate.socket_write_buffer_drained(self)
+
+    def socket_did_send_file(self, fileobj):
+        if hasattr(self.delegate, 'socket_did_send_file'):
+            self.delegate.socket_did_send_file(self, fileobj)
@@ -1,5 +1,4 @@
-import time
-from zokket.runloop import DefaultRunloop
+from zokket.runloop import DefaultRunloop, monotonic
 
 
 class Timer(object):
@@ -26,10 +25,10 @@ class Timer(object):
         self._runloop = runloop
 
     def update_timeout(self):
-        self.fire_at = time.time() + self.interval
+        self.fire_at = monotonic() + self.interval
 
     def timeout(self):
-        return self.fire_at - time.time()
+        return self.fire_at - monotonic()
 
     def fire(self):
         self.callback(self)
@@ -0,0 +1,241 @@
+import time
+from collections import OrderedDict
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+
+def create_context(server_side, keyfile=None, certfile=None, cert_reqs=None,
+        ca_certs=None, version=None):
+    """
+    Build an SSLContext from the `TCPSocket.start_tls` arguments.
+    """
+
+    if version is None or version == ssl.PROTOCOL_SSLv23:
+        if server_side:
+            version = getattr(ssl, 'PROTOCOL_TLS_SERVER', ssl.PROTOCOL_SSLv23)
+        else:
+            version = getattr(ssl, 'PROTOCOL_TLS_CLIENT', ssl.PROTOCOL_SSLv23)
+
+    context = ssl.SSLContext(version)
+
+    if not server_side:
+        context.check_hostname = False
+
+    context.verify_mode = ssl.CERT_NONE if cert_reqs is None else cert_reqs
+
+    if certfile:
+        context.load_cert_chain(certfile, keyfile)
+
+    if ca_certs:
+        context.load_verify_locations(ca_certs)
+
+    if server_side:
+        # Session tickets are encrypted with a key belonging to the context,
+        # sharing the context lets any connection resume the session.
+        context.options &= ~getattr(ssl, 'OP_NO_TICKET', 0)
+
+    return context
+
+
+class TLSCache(object):
+    """
+    Shares SSLContexts between sockets with the same TLS configuration, so
+    certificates are loaded once and servers can resume sessions from their
+    session tickets, and keeps the sessions of client connections per host
+    and port so reconnects resume them instead of doing a full handshake.
+
+    The amount of handshakes and how many of them resumed a session are
+    counted, see `statistics`.
+    """
+
+    def __init__(self, max_sessions=1024):
+        self.contexts = {}
+        self.sessions = OrderedDict()
+        self.max_sessions = max_sessions
+
+        self.handshakes = 0
+        self.resumed_handshakes = 0
+
+    @classmethod
+    def default(cls):
+        if not hasattr(cls, '_cache'):
+            cls._cache = cls()
+        return cls._cache
+
+    def context(self, server_side, keyfile=None, certfile=None, cert_reqs=None,
+            ca_certs=None, version=None):
+        key = (server_side, keyfile, certfile, cert_reqs, ca_certs, version)
+
+        context = self.contexts.get(key)
+        if context is None:
+            context = create_context(server_side, keyfile, certfile, cert_reqs,
+                                     ca_certs, version)
+            self.contexts[key] = context
+
+        return context
+
+    def session(self, context, host, port):
+        """
+        A session to resume for a new client connection to host and port.
+        """
+
+        key = (id(context), host, port)
+        session = self.sessions.get(key)
+
+        if session is not None and time.time() >= session.time + session.timeout:
+            del self.sessions[key]
+            return None
+
+        return session
+
+    def store_session(self, sslsock, host, port):
+        if sslsock.server_side:
+            return
+
+        try:
+            session = sslsock.session
+        except ValueError:
+            # There is no session yet.
+            return
+
+        if session is None:
+            return
+
+        key = (id(sslsock.context), host, port)
+        self.sessions[key] = session
+        self.sessions.move_to_end(key)
+
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+
+    def record_handshake(self, sslsock):
+        self.handshakes += 1
+
+        if getattr(sslsock, 'session_reused', False):
+            self.resumed_handshakes += 1
+
+    def statistics(self):
+        return {
+            'contexts': len(self.contexts),
+            'sessions': len(self.sessions),
+            'handshakes': self.handshakes,
+            'resumed_handshakes': self.resumed_handshakes,
+        }
+
+
+class TLSEngine(object):
+    """
+    Runs a TLS connection over memory buffers with an `ssl.SSLObject`
+    instead of wrapping the socket, so encryption is decoupled from the file
+    descriptor and works with any runloop. The socket feeds the engine the
+    ciphertext it receives and writes the ciphertext the engine produces.
+    """
+
+    def __init__(self, context, server_side=False, server_hostname=None,
+            session=None):
+        self.incoming = ssl.MemoryBIO()
+        self.outgoing = ssl.MemoryBIO()
+        self.sslobj = context.wrap_bio(self.incoming, self.outgoing,
+                                       server_side=server_side,
+                                       server_hostname=server_hostname,
+                                       session=session)
+
+        self.handshake_complete = False
+        self.shutting_down = False
+        self.eof = False
+
+    @property
+    def established(self):
+        """
+        Whether application data can be encrypted.
+        """
+
+        return self.handshake_complete and not self.shutting_down
+
+    def feed(self, data):
+        """
+        Feed ciphertext received from the peer to the engine.
+        """
+
+        self.incoming.write(data)
+
+    def ciphertext(self):
+        """
+        Returns the ciphertext waiting to be written to the peer.
+        """
+
+        return self.outgoing.read()
+
+    def do_handshake(self):
+        """
+        Advance the handshake with the ciphertext received so far, returns
+        True once it has completed.
+        """
+
+        try:
+            self.sslobj.do_handshake()
+        except ssl.SSLWantReadError:
+            return False
+
+        self.handshake_complete = True
+        return True
+
+    def read_into(self, buffer):
+        """
+        Decrypt received data into buffer, returns the amount of bytes
+        decrypted. Returns 0 when more ciphertext is needed, or when the
+        peer ended the TLS session in which case `eof` is set.
+        """
+
+        try:
+            decrypted = self.sslobj.read(len(buffer), buffer)
+        except ssl.SSLWantReadError:
+            return 0
+        except ssl.SSLZeroReturnError:
+            decrypted = 0
+
+        if not decrypted:
+            self.eof = True
+
+        return decrypted
+
+    def write(self, data):
+        """
+        Encrypt data, the records are read with `ciphertext`.
+        """
+
+        self.sslobj.write(data)
+
+    def unwrap(self):
+        """
+        Send a close_notify alert, returns True once the peer has sent its
+        close_notify too. Data the peer sent before its close_notify must
+        be read first, see `eof`.
+        """
+
+        self.shutting_down = True
+
+        try:
+            self.sslobj.unwrap()
+        except ssl.SSLWantReadError:
+            pass
+
+        return self.eof
+
+    def unused_data(self):
+        """
+        Returns the data received after the peers close_notify, which is
+        no longer encrypted.
+        """
+
+        return self.incoming.read()
+
+    def pending(self):
+        """
+        The amount of decrypted bytes which haven't been read yet.
+        """
+
+        return self.sslobj.pending()
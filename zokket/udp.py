@@ -1,6 +1,11 @@
+import errno
 import socket
+from collections import deque
 
 from zokket.runloop import DefaultRunloop
+from zokket.timers import Timer
+from zokket.resolver import address_family, is_ip_address, unmap_address
+from zokket.shaping import UPLOAD, DOWNLOAD, limiters_for, ready, consume, delay
 
 
 class UDPSocketDelegate(object):
@@ -9,15 +14,32 @@ class UDPSocketDelegate(object):
 
 
 class UDPSocket(object):
-    def __init__(self, delegate=None, runloop=None):
+    def __init__(self, delegate=None, runloop=None, family=socket.AF_INET):
+        """
+        With family set to `socket.AF_INET6` the socket is dual-stack and
+        can send to and receive from both IPv6 and IPv4 addresses.
+        """
+
         self.delegate = delegate
 
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.family = family
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
         self.socket.setblocking(0)
 
+        if family == getattr(socket, 'AF_INET6', None):
+            try:
+                self.socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+            except (AttributeError, socket.error):
+                pass
+
         self.uploaded_bytes = 0
         self.downloaded_bytes = 0
 
+        self.rate_limiters = []
+        self.send_queue = deque()
+        self.read_throttle = None
+        self.write_throttle = None
+
         self.runloop = runloop
         self.runloop.register_socket(self)
 
@@ -48,10 +70,64 @@ class UDPSocket(object):
         self.socket.bind((host, port))
 
     def send(self, host, port, data):
+        """
+        Send a datagram. While the `rate_limiters` don't allow it to be sent
+        the datagram is queued, and sent once they do.
+        """
+
+        if self.family == getattr(socket, 'AF_INET6', None) and \
+                is_ip_address(host) and address_family(host) == socket.AF_INET:
+            host = '::ffff:' + host
+
+        if self.send_queue or not ready(limiters_for(self), UPLOAD):
+            self.send_queue.append((data, (host, port)))
+            self.throttle_writing()
+            return
+
+        self.sendto(data, (host, port))
+
+    def sendto(self, data, address):
         self.uploaded_bytes += len(data)
-        self.socket.sendto(data, (host, port))
+        consume(limiters_for(self), UPLOAD, len(data))
+        self.socket.sendto(data, address)
+
+    # Rate Limiting
+
+    def throttle_reading(self):
+        if self.read_throttle is None:
+            self.read_throttle = Timer(delay(limiters_for(self), DOWNLOAD, 1),
+                                       self.unthrottle_reading, runloop=self.runloop)
+            self.runloop.update_socket(self)
+
+    def unthrottle_reading(self, timer):
+        self.read_throttle = None
+
+        if self.socket != None:
+            self.runloop.update_socket(self)
+
+    def throttle_writing(self):
+        if self.write_throttle is None:
+            self.write_throttle = Timer(delay(limiters_for(self), UPLOAD, 1),
+                                        self.unthrottle_writing, runloop=self.runloop)
+
+    def unthrottle_writing(self, timer):
+        self.write_throttle = None
+
+        while self.send_queue and self.socket != None and \
+                ready(limiters_for(self), UPLOAD):
+            self.sendto(*self.send_queue.popleft())
+
+        if self.send_queue and self.socket != None:
+            self.throttle_writing()
 
     def close(self):
+        for timer in (self.read_throttle, self.write_throttle):
+            if timer is not None:
+                timer.invalidate()
+
+        self.read_throttle = self.write_throttle = None
+        self.send_queue.clear()
+
         if self.socket:
             self.runloop.unregister_socket(self)
 
@@ -68,17 +144,39 @@ class UDPSocket(object):
     # Runloop Callbacks
 
     def readable(self):
-        return self.socket != None
+        return self.socket != None and self.read_throttle is None
 
     def writable(self):
         return False
 
     def handle_read_event(self):
-        data, addr = self.socket.recvfrom(65565)
-        self.downloaded_bytes += len(data)
-
-        if hasattr(self.delegate, 'udp_socket_read_data'):
-            self.delegate.udp_socket_read_data(self, addr[0], addr[1], data)
+        while self.socket != None:
+            try:
+                data, addr = self.socket.recvfrom(65565)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+
+            self.downloaded_bytes += len(data)
+
+            limiters = limiters_for(self)
+            if limiters:
+                consume(limiters, DOWNLOAD, len(data))
+
+                if not ready(limiters, DOWNLOAD):
+                    # Datagrams arriving in the meantime are dropped by the
+                    # kernel once its receive buffer is full.
+                    self.throttle_reading()
+
+            if hasattr(self.delegate, 'udp_socket_read_data'):
+                self.delegate.udp_socket_read_data(self, unmap_address(addr[0]), addr[1], data)
+
+            # An edge-triggered runloop won't notify us again about the
+            # datagrams which are already waiting, read until none are left.
+            if not getattr(self.runloop, 'edge_triggered', False) or \
+                    self.read_throttle is not None:
+                return
 
     def handle_write_event(self):
         pass
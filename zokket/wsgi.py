@@ -66,7 +66,7 @@ class WSGIRequestHandler(object):
         self.handle_request()
         self.send_response()
 
-        self.socket.socket.shutdown(socket.SHUT_WR)
+        self.socket.shutdown_write()
 
         conntype = self.headers.get('Connection', "")
         if conntype.lower() != 'keep-alive':
@@ -82,26 +82,36 @@ class WSGIRequestHandler(object):
 
     def send_error(self, error, explain):
         self.status = error
-        self.data = explain
+        self.data = [explain]
         self.response_headers = [('Content-type', 'text/plain')]
         self.send_response()
         self.socket.close()
 
     def send_response(self):
-        self.socket.send("{} {}\r\n".format(self.version, self.status))
-        self.socket.send("\r\n".join(['{}: {}'.format(*header) for header in self.response_headers]) + "\r\n\r\n")
-        self.socket.send("\n".join(self.data) + "\r\n\r\n")
+        head = "{} {}\r\n".format(self.version, self.status)
+        head += "\r\n".join(['{}: {}'.format(*header) for header in self.response_headers]) + "\r\n\r\n"
+
+        # The body is queued a chunk at a time and written alongside the
+        # head with one system call, instead of being joined into a copy.
+        buffers = [head]
+        for chunk in self.data:
+            if len(buffers) > 1:
+                buffers.append("\n")
+            buffers.append(chunk)
+        buffers.append("\r\n\r\n")
+
+        self.socket.send(buffers)
 
 
 class WSGIServer(object):
     protocol_version = "HTTP/1.0"
     request_version = "HTTP/0.9"
 
-    def __init__(self, handler, host='', port=8082):
+    def __init__(self, handler, host='', port=8082, reuse_port=False):
         self.handler = handler
 
         self.socket = TCPSocket(self)
-        self.socket.accept(host, port)
+        self.socket.accept(host, port, reuse_port=reuse_port)
 
         self.base_environ = {}
         self.base_environ['SERVER_NAME'] = socket.getfqdn(self.socket.local_host())